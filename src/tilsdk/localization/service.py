@@ -2,7 +2,6 @@ import urllib3
 from .types import *
 import json
 import base64
-import matplotlib.pyplot as plt
 import io
 from typing import List, Tuple
 import logging
@@ -24,12 +23,22 @@ class LocalizationService:
         self.manager = urllib3.PoolManager()
         logging.getLogger('Localization').info(f"Localization Service connecting to {self.url}.")
 
-    def get_map(self) -> SignedDistanceGrid:
+    def get_map(self, cache_dir:str=None) -> SignedDistanceGrid:
         '''Get a grid-based representation of the of the map.
         
         Grid elements are square and represented by a float. Value indicates distance from nearest
         obstacle. Value <= 0 indicates occupied, > 0 indicates passable.
         Grid is centered-aligned, i.e. real-world postion maps to center of grid square.
+
+        The ready-made grid is fetched from the server's binary ``/map/sdf`` endpoint
+        (see :meth:`SignedDistanceGrid.from_bytes`). Servers without it send the map
+        image, from which the grid is computed locally.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory for cached map artifacts, see :meth:`SignedDistanceGrid.from_image`.
+            The map is recomputed on every call if not given. Unused with ``/map/sdf``.
         
         Returns
         -------
@@ -37,6 +46,15 @@ class LocalizationService:
             Signed distance grid.
         '''
 
+        response = self.manager.request(method='GET',
+                                        url=self.url+'/map/sdf')
+
+        if response.status == 200:
+            return SignedDistanceGrid.from_bytes(response.data)
+
+        logging.getLogger('Localization').debug('No binary map endpoint, falling back to map image.')
+        import matplotlib.pyplot as plt  # only needed to decode the map image.
+
         response = self.manager.request(method='GET',
                                         url=self.url+'/map')
 
@@ -45,7 +63,7 @@ class LocalizationService:
         grid = base64.decodebytes(data['map']['grid'].encode('utf-8'))
 
         img = plt.imread(io.BytesIO(grid))
-        grid = SignedDistanceGrid.from_image(img, data['map']['scale'])
+        grid = SignedDistanceGrid.from_image(img, data['map']['scale'], cache_dir=cache_dir)
 
         return grid
 
@@ -1,11 +1,35 @@
+import hashlib
+import os
+import struct
 import numpy as np
+from numpy.typing import ArrayLike
 from typing import Any, Optional, Tuple, List, Union, NamedTuple, overload
-from scipy.ndimage import distance_transform_edt
+from scipy.ndimage import distance_transform_edt, label
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
 ### Consts and Types ####
 
+# Header of the binary grid format, see SignedDistanceGrid.to_bytes(): magic, dtype code,
+# height, width, scale, quantization step and version. 40 bytes keeps the data 8-byte aligned.
+_GRID_HEADER = struct.Struct('<4sB3xIIddI4x')
+_GRID_MAGIC = b'SDG1'
+_GRID_DTYPES = {0: np.dtype('<f4'), 1: np.dtype('<i2')}
+
 _SQRT2 = 1.4142135623730951
 
+NEIGHBOUR_DIRECTIONS: Tuple[Tuple[int, int, float], ...] = (
+    (-1, -1, _SQRT2), # NW
+    ( 0, -1, 1.0   ), # N
+    ( 1, -1, _SQRT2), # NE
+    (-1,  0, 1.0   ), # W
+    ( 1,  0, 1.0   ), # E
+    (-1,  1, _SQRT2), # SW
+    ( 0,  1, 1.0   ), # S
+    ( 1,  1, _SQRT2), # SE
+)
+'''8-connected neighbour directions (dx, dy, step cost). Bit i of a neighbour mask refers to entry i.'''
+
 class GridLocation(NamedTuple):
     '''Pixel coordinates (x, y)'''
 
@@ -107,9 +131,13 @@ class SignedDistanceGrid:
 
     Grid is centered-aligned, i.e. real-world postion
     corresponds to center of grid square.
+
+    Dilated grids (see :meth:`dilated`) share the distance array of the grid they
+    were made from and only store an `offset`, which every lookup subtracts.
     '''
 
-    def __init__(self, width:int=0, height:int=0, grid:Optional[Any]=None, scale:float=1.0):
+    def __init__(self, width:int=0, height:int=0, grid:Optional[Any]=None, scale:float=1.0,
+                 dtype:Optional[Any]=None, offset:float=0.0):
         '''
         Parameters
         ----------
@@ -121,38 +149,161 @@ class SignedDistanceGrid:
             Numpy array of grid data, corresponding to a grid of width m and heigh n.
         scale : float
             Ratio of real-world unit to grid unit.
+        dtype : optional
+            Storage type of the grid, e.g. np.float32 to halve memory. Keeps the type
+            of `grid` if not given.
+        offset : float
+            Distance in grid units subtracted from every grid value, see :meth:`dilated`.
         '''
 
         self.scale = scale
+        # Number of halvings from the full resolution grid, see pyramid().
+        self._level = 0
+
+        # Lazily built lookup tables, see _cached().
+        self._cache = {}
+        self._cache_grid = None
+        self._cache_version = 0
+        # Directory of on-disk tables for this grid, see from_image().
+        self._artifact_dir = None
 
         if grid is not None:
-            self.grid = grid
+            self.grid = grid if dtype is None else np.asarray(grid, dtype=dtype)
             self.width = grid.shape[1]
             self.height = grid.shape[0]
         else:
-            self.grid = np.inf((height, width), dtype=float)
+            self.grid = np.full((height, width), np.inf, dtype=float if dtype is None else dtype)
+            self.width = width
+            self.height = height
+        self.offset = offset
+
+    @property
+    def grid(self) -> np.ndarray:
+        '''Signed distances in grid units.
+
+        For a dilated grid this is built from the shared array on first access and
+        cached; lookups like :meth:`passable` never need it.
+        '''
+        if self.offset == 0:
+            return self._grid
+        return self._cached('grid', lambda: self._grid - np.asarray(self.offset, dtype=self._grid.dtype))
+
+    @grid.setter
+    def grid(self, grid:Any):
+        # distance array and edit counter, shared with dilated views, see update_obstacles().
+        self._shared = {'grid': grid, 'version': 0}
+        self.offset = 0.0
+        self._artifact_dir = None
+
+    @property
+    def _grid(self) -> np.ndarray:
+        '''Undilated distance array, shared with dilated views.'''
+        return self._shared['grid']
+
+    @property
+    def version(self) -> int:
+        '''Number of :meth:`update_obstacles` edits of the grid, shared with its dilated views.'''
+        return self._shared['version']
 
     @staticmethod
-    def from_image(img:Any, scale:float=1.0):
+    def from_image(img:Any, scale:float=1.0, dtype:Any=float, cache_dir:Optional[str]=None):
         '''Factory method to create map from image.
         
         Only the first channel is used. Channel value should be 0 where passable.
 
+        With `cache_dir`, the signed distance grid is saved as a ``.npy`` file in a
+        subdirectory named after a hash of the obstacle layout, together with
+        derived tables (connected components, nearest passable cells) once they are
+        first built. Later loads of the same image memory-map those files instead of
+        recomputing them. The grid is mapped copy-on-write, so in-place edits never
+        reach the disk.
+
         Parameters
         ----------
         img : Any
             Input image.
         scale : float
             Ratio of real-world unit to grid unit.
+        dtype : optional
+            Storage type of the grid, e.g. np.float32 to halve memory.
+        cache_dir : str, optional
+            Directory for cached map artifacts, created if needed.
 
         Returns
         -------
         map : SignedDistanceGrid
         '''
         bin_img = img[:,:,0] > 0
+
+        artifact_dir = None
+        if cache_dir is not None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(repr(bin_img.shape).encode())
+            h.update(np.packbits(bin_img).data)
+            artifact_dir = os.path.join(cache_dir, h.hexdigest())
+            path = os.path.join(artifact_dir, f'sdf_{np.dtype(dtype).str[1:]}.npy')
+            if os.path.exists(path):
+                map_ = SignedDistanceGrid(grid=np.load(path, mmap_mode='c'), scale=scale)
+                map_._artifact_dir = artifact_dir
+                return map_
+
         grid = distance_transform_edt(1-bin_img) - distance_transform_edt(bin_img) 
+        map_ = SignedDistanceGrid(grid=grid, scale=scale, dtype=dtype)
+
+        if artifact_dir is not None:
+            _save_artifact(path, map_.grid)
+            map_._artifact_dir = artifact_dir
+        return map_
+
+    def to_bytes(self, dtype:Any=np.float32) -> bytes:
+        '''Serialize the grid into a compact binary buffer, see :meth:`from_bytes`.
+
+        The buffer is a 40 byte header (shape, scale, :attr:`version`) followed by the
+        raw little-endian grid values.
+
+        Parameters
+        ----------
+        dtype : optional
+            np.float32, or np.int16 to halve the size again by quantizing distances to
+            1/32767 of the largest one.
+        '''
+        code = {np.dtype(v): k for k, v in _GRID_DTYPES.items()}[np.dtype(dtype).newbyteorder('<')]
+        grid = np.asarray(self.grid)
+        step = 1.0
+        if code == 1:
+            finite = np.abs(grid[np.isfinite(grid)])
+            step = float(finite.max())/32767 if finite.size and finite.max() > 0 else 1.0
+            grid = np.clip(np.rint(grid/step), -32767, 32767)
+        header = _GRID_HEADER.pack(_GRID_MAGIC, code, self.height, self.width, self.scale, step, self.version)
+        return header + np.ascontiguousarray(grid, dtype=_GRID_DTYPES[code]).tobytes()
+
+    @staticmethod
+    def from_bytes(buf:bytes):
+        '''Factory method to create map from a buffer made by :meth:`to_bytes`.
+
+        Float32 grids are loaded zero-copy with ``np.frombuffer``, so the grid is
+        read-only until :meth:`update_obstacles` first copies it; int16 grids are
+        dequantized into a new float32 array.
+
+        Parameters
+        ----------
+        buf : bytes
+            Serialized grid.
 
-        return SignedDistanceGrid(grid=grid, scale=scale)
+        Returns
+        -------
+        map : SignedDistanceGrid
+        '''
+        magic, code, height, width, scale, step, version = _GRID_HEADER.unpack_from(buf)
+        if magic != _GRID_MAGIC or code not in _GRID_DTYPES:
+            raise ValueError('Not a serialized SignedDistanceGrid.')
+        grid = np.frombuffer(buf, dtype=_GRID_DTYPES[code], count=height*width,
+                             offset=_GRID_HEADER.size).reshape(height, width)
+        if code == 1:
+            grid = grid.astype(np.float32)*np.float32(step)
+        map_ = SignedDistanceGrid(grid=grid, scale=scale)
+        map_._shared['version'] = version
+        return map_
 
     def in_bounds(self, id:GridLocation) -> bool:
         '''Check if grid location is in bounds.
@@ -183,7 +334,7 @@ class SignedDistanceGrid:
         bool
             True if location is in passable.
         '''
-        return self.grid[id[1], id[0]] > 0
+        return self._grid[id[1], id[0]] > self.offset
 
     def neighbours(self, id:GridLocation) -> List[Tuple[GridLocation, float]]:
         '''Get valid neighbours and cost of grid location.
@@ -212,9 +363,352 @@ class SignedDistanceGrid:
 
         results = filter(lambda n: self.in_bounds(n[0]), neighbours)
         results = filter(lambda n: self.passable(n[0]), results)
-        results = [(*r, self.grid[r[0][1], r[0][0]]) for r in results]
+        results = [(*r, self._grid[r[0][1], r[0][0]] - self.offset) for r in results]
         return results
 
+    def line_of_sight(self, a:GridLocation, b:GridLocation, clearance:float=0.0) -> bool:
+        '''Check if the straight segment between two grid locations keeps `clearance`.
+
+        The segment is sampled at half-cell spacing and every sample's cell must be in
+        bounds with a signed distance greater than `clearance`, all in one vectorized
+        lookup.
+
+        Parameters
+        ----------
+        a : GridLocation
+            Segment start.
+        b : GridLocation
+            Segment end.
+        clearance : float
+            Minimum distance to obstacles in terms of **real** units.
+
+        Returns
+        -------
+        bool
+            True if the whole segment keeps the clearance.
+        '''
+        cells = self.segment_cells(a, b)
+        if cells is None:
+            return False
+        return bool(np.all(self._grid.ravel()[cells] > clearance/self.scale + self.offset))
+
+    def segment_cells(self, a:GridLocation, b:GridLocation) -> Optional[np.ndarray]:
+        '''Flat indices (``y*width + x``) of the cells under a straight segment.
+
+        The segment is sampled at half-cell spacing from `a` to `b`, so cells may
+        repeat.
+
+        Parameters
+        ----------
+        a : GridLocation
+            Segment start.
+        b : GridLocation
+            Segment end.
+
+        Returns
+        -------
+        np.ndarray or None
+            Indices of sampled cells in order, or None if the segment leaves the grid.
+        '''
+        x0, y0 = a[0], a[1]
+        x1, y1 = b[0], b[1]
+        n = int(2*max(abs(x1 - x0), abs(y1 - y0))) + 1
+        t = np.linspace(0.0, 1.0, n + 1)
+        xs = np.rint(x0 + (x1 - x0)*t).astype(np.intp)
+        ys = np.rint(y0 + (y1 - y0)*t).astype(np.intp)
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= self.width or ys.max() >= self.height:
+            return None
+        return ys*self.width + xs
+
+    def _cached(self, key:Any, build, persist:bool=False):
+        '''Return cached table `key`, building it with `build()` if needed.
+
+        The whole cache is dropped when `self.grid` is replaced by another array or
+        :attr:`version` changes. With `persist`, array tables of unedited grids are also
+        kept in the artifact directory of grids loaded by :meth:`from_image` with a
+        `cache_dir`, and memory-mapped from there.
+        '''
+        if self._cache_grid is not self._grid or self._cache_version != self.version:
+            self._cache.clear()
+            self._cache_grid = self._grid
+            self._cache_version = self.version
+        if key not in self._cache:
+            path = None
+            if persist and self._artifact_dir is not None and self.version == 0:
+                path = os.path.join(self._artifact_dir, f'{key}_{self.offset!r}.npy' if self.offset else f'{key}.npy')
+            if path is not None and os.path.exists(path):
+                self._cache[key] = np.load(path, mmap_mode='r')
+            else:
+                self._cache[key] = build()
+                if path is not None and isinstance(self._cache[key], np.ndarray):
+                    _save_artifact(path, self._cache[key])
+        return self._cache[key]
+
+    def fingerprint(self) -> str:
+        '''Hex digest identifying the grid contents, shape, scale and offset.
+
+        Computed once and cached, so in-place edits of `grid` are not noticed.
+        '''
+        def build():
+            grid = np.ascontiguousarray(self._grid)
+            h = hashlib.blake2b(digest_size=16)
+            h.update(repr((grid.shape, grid.dtype.str, self.scale, self.offset)).encode())
+            h.update(grid.data)
+            return h.hexdigest()
+
+        return self._cached('fingerprint', build)
+
+    def passable_mask(self) -> np.ndarray:
+        '''Boolean (height, width) array, True where the grid is passable.
+
+        Built once and cached.
+        '''
+        return self._cached('passable', lambda: np.asarray(self._grid) > self.offset)
+
+    def component_labels(self) -> np.ndarray:
+        '''Int32 (height, width) array of connected components of passable cells.
+
+        Cells are connected through the same 8 moves as :meth:`neighbours`. Passable
+        cells get labels from 1, obstacles 0, so two passable cells are mutually
+        reachable exactly when their labels are equal. Built once and cached.
+        '''
+        def build():
+            labels, _ = label(self.passable_mask(), structure=np.ones((3, 3), dtype=bool), output=np.int32)
+            return labels
+
+        return self._cached('component_labels', build, persist=True)
+
+    def nearest_in_component(self, id:GridLocation, component:int) -> GridLocation:
+        '''Cell of connected component `component` closest (euclidean) to `id`.
+
+        Parameters
+        ----------
+        id : GridLocation
+            Query location, may be off-map or in an obstacle.
+        component : int
+            Label from :meth:`component_labels`.
+
+        Returns
+        -------
+        GridLocation
+            Closest cell with that label.
+        '''
+        ys, xs = np.nonzero(self.component_labels() == component)
+        i = np.argmin((xs - id[0])**2 + (ys - id[1])**2)
+        return GridLocation(int(xs[i]), int(ys[i]))
+
+    def nearest_passable(self, id:GridLocation) -> Optional[GridLocation]:
+        '''Passable cell closest (euclidean) to a grid location, in constant time.
+
+        Locations off the map are first clamped onto it. The lookup uses the nearest
+        feature indices of a distance transform, built once and cached.
+
+        Parameters
+        ----------
+        id : GridLocation
+            Query location.
+
+        Returns
+        -------
+        GridLocation or None
+            `id` itself if it is passable, the closest passable cell otherwise, or None
+            if the map has no passable cell.
+        '''
+        def build():
+            passable = self.passable_mask()
+            if not passable.any():
+                return None
+            _, (ys, xs) = distance_transform_edt(~passable, return_indices=True)
+            return (ys*self.width + xs).astype(np.int32).ravel()
+
+        nearest = self._cached('nearest_passable', build, persist=True)
+        if nearest is None:
+            return None
+        x = min(max(int(id[0]), 0), self.width - 1)
+        y = min(max(int(id[1]), 0), self.height - 1)
+        y, x = divmod(int(nearest[y*self.width + x]), self.width)
+        return GridLocation(x, y)
+
+    def neighbour_mask(self) -> np.ndarray:
+        '''Flat (height*width,) uint8 array of valid neighbour directions per cell.
+
+        Bit i is set if moving in direction ``NEIGHBOUR_DIRECTIONS[i]`` stays in bounds
+        and lands on a passable cell. Cells are indexed by ``y*width + x``. Built once
+        and cached.
+        '''
+        def build():
+            padded = np.pad(self.passable_mask(), 1, constant_values=False)
+            mask = np.zeros((self.height, self.width), dtype=np.uint8)
+            for i, (dx, dy, _) in enumerate(NEIGHBOUR_DIRECTIONS):
+                shifted = padded[1+dy:1+dy+self.height, 1+dx:1+dx+self.width]
+                mask |= shifted.astype(np.uint8) << i
+            return mask.ravel()
+
+        return self._cached('neighbour_mask', build)
+
+    def neighbour_offsets(self) -> Tuple[Tuple[Tuple[int, int, int, float], ...], ...]:
+        '''Lookup table from neighbour mask to valid moves.
+
+        Entry ``m`` holds a tuple of ``(flat offset, dx, dy, step cost)`` for every
+        direction bit set in mask ``m``. Together with :meth:`neighbour_mask` this
+        lets a search expand a cell without any bounds or passability checks.
+        '''
+        def build():
+            moves = [(dy*self.width + dx, dx, dy, cost) for dx, dy, cost in NEIGHBOUR_DIRECTIONS]
+            return tuple(
+                tuple(move for i, move in enumerate(moves) if m & (1 << i))
+                for m in range(256)
+            )
+
+        return self._cached('neighbour_offsets', build)
+
+    def medial_axis(self, min_separation:float=3.0) -> np.ndarray:
+        '''Boolean (height, width) mask of the medial axis (Voronoi skeleton) of free space.
+
+        A passable cell is on the axis if its nearest obstacle cell and that of a
+        neighbouring cell are more than `min_separation` cells and the cell's clearance
+        apart, i.e. the two cells are closest to different walls. Higher values ignore ridges caused by small
+        bumps in the walls. Cells outside the grid count as obstacles. Built once per
+        `min_separation` and cached.
+        '''
+        def build():
+            free = np.pad(self.passable_mask(), 1, constant_values=False)
+            if free.all():
+                return np.zeros((self.height, self.width), dtype=bool)
+
+            # feature transform: coordinates of the nearest obstacle cell of every cell.
+            _, (fy, fx) = distance_transform_edt(free, return_indices=True)
+            dist = np.asarray(self._grid) - self.offset
+            axis = np.zeros((self.height, self.width), dtype=bool)
+            fy, fx = fy[1:-1, 1:-1], fx[1:-1, 1:-1]
+            inside = free[1:-1, 1:-1]
+            for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                h, w = self.height - dy, self.width - abs(dx)
+                a = (slice(0, h), slice(max(-dx, 0), max(-dx, 0) + w))
+                b = (slice(dy, dy + h), slice(max(dx, 0), max(dx, 0) + w))
+                # the nearest walls must also subtend more than 60 degrees, which drops the
+                # spurious ridges fanning out from rounded (digitized) corners.
+                separation = (fy[a] - fy[b])**2 + (fx[a] - fx[b])**2
+                apart = (separation > np.maximum(min_separation, np.maximum(dist[a], dist[b]))**2) & inside[a] & inside[b]
+                # keep the cell of the pair that is farther from the walls, so the axis stays thin.
+                a_higher = dist[a] >= dist[b]
+                axis[a] |= apart & a_higher
+                axis[b] |= apart & ~a_higher
+            return axis
+
+        return self._cached(('medial_axis', min_separation), build)
+
+    def traversal_cost(self, sdf_weight:float) -> np.ndarray:
+        '''Flat (height*width,) array of the cost of entering each cell.
+
+        The cost is the SDF penalty ``sdf_weight*(1/sdf)`` used by the planner, and
+        ``inf`` for impassable cells. Only the table for the most recent
+        `sdf_weight` is kept.
+
+        Parameters
+        ----------
+        sdf_weight : float
+            Relative weight of distance in cost function.
+        '''
+        def build():
+            grid = np.asarray(self._grid, dtype=float) - self.offset
+            cost = np.full(grid.shape, np.inf)
+            passable = self.passable_mask()
+            cost[passable] = sdf_weight*(1/grid[passable])
+            return cost.ravel()
+
+        return self._cached_weighted('traversal_cost', sdf_weight, build)
+
+    def transition_graph(self, sdf_weight:float, reverse:bool=False) -> csr_matrix:
+        '''Sparse (n, n) matrix of move costs between neighbouring cells, n = height*width.
+
+        Entry (i, j) is the cost of moving from cell i to neighbouring cell j, i.e.
+        step length plus :meth:`traversal_cost` of j. Suitable for
+        :mod:`scipy.sparse.csgraph` routines. Only the graphs for the most recent
+        `sdf_weight` are kept.
+
+        Parameters
+        ----------
+        sdf_weight : float
+            Relative weight of distance in cost function.
+        reverse : bool
+            Return the transposed graph, whose shortest path distances from a
+            cell are costs-to-go towards that cell.
+        '''
+        def build():
+            if reverse:
+                return self.transition_graph(sdf_weight).transpose().tocsr()
+
+            n = self.width*self.height
+            # only moves out of passable cells are edges.
+            mask = np.where(self.passable_mask().ravel(), self.neighbour_mask(), 0)
+            cell_cost = self.traversal_cost(sdf_weight)
+            rows, cols, costs = [], [], []
+            for i, (dx, dy, step) in enumerate(NEIGHBOUR_DIRECTIONS):
+                src = np.flatnonzero(mask & (1 << i))
+                dst = src + (dy*self.width + dx)
+                rows.append(src)
+                cols.append(dst)
+                costs.append(step + cell_cost[dst])
+            return csr_matrix((np.concatenate(costs), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+        return self._cached_weighted('transition_graph_T' if reverse else 'transition_graph', sdf_weight, build)
+
+    def landmark_distances(self, sdf_weight:float, count:int=8) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''Shortest path distances to and from landmark cells, for ALT heuristics.
+
+        Landmarks are picked by farthest-point sampling over passable cells, so they
+        end up in dead-ends and corners of the map. By the triangle inequality, the cost
+        from cell v to goal t is at least ``from_[k, t] - from_[k, v]`` and
+        ``to[k, v] - to[k, t]`` for every landmark k. Only the tables for the most
+        recent `sdf_weight` are kept.
+
+        Parameters
+        ----------
+        sdf_weight : float
+            Relative weight of distance in cost function.
+        count : int
+            Number of landmarks.
+
+        Returns
+        -------
+        landmarks : np.ndarray
+            (k,) flat indices of the landmark cells.
+        from_ : np.ndarray
+            (k, n) float32 cost from each landmark to every cell, inf if unreachable.
+        to : np.ndarray
+            (k, n) float32 cost from every cell to each landmark, inf if unreachable.
+        '''
+        def build():
+            graph = self.transition_graph(sdf_weight)
+            passable = np.flatnonzero(self.passable_mask())
+            if passable.size == 0:
+                empty = np.empty((0, self.width*self.height), dtype=np.float32)
+                return np.empty(0, dtype=np.int64), empty, empty
+
+            # the first landmark is the cell farthest from an arbitrary passable cell.
+            nearest = dijkstra(graph, indices=passable[0])[passable]
+            landmarks, fields = [], []
+            for _ in range(min(count, passable.size)):
+                landmark = passable[np.argmax(nearest)]
+                field = dijkstra(graph, indices=landmark)
+                landmarks.append(landmark)
+                fields.append(field.astype(np.float32))
+                nearest = np.minimum(nearest, field[passable]) if len(landmarks) > 1 else field[passable]
+
+            to = dijkstra(self.transition_graph(sdf_weight, reverse=True), indices=landmarks).astype(np.float32)
+            return np.array(landmarks, dtype=np.int64), np.stack(fields), to
+
+        return self._cached_weighted(f'landmarks_{count}', sdf_weight, build)
+
+    def _cached_weighted(self, name:str, sdf_weight:float, build):
+        '''Like :meth:`_cached`, but keeps only the most recent `sdf_weight` for `name`.'''
+        key = (name, sdf_weight)
+        if key not in self._cache:
+            for k in [k for k in self._cache if isinstance(k, tuple) and k[0] == name]:
+                del self._cache[k]
+        return self._cached(key, build)
+
     def real_to_grid(self, id:RealLocation) -> GridLocation:
         '''Convert real coordinates to grid coordinates.
         
@@ -228,6 +722,10 @@ class SignedDistanceGrid:
         GridLocation
             Corresponding GridLocation.
         '''
+        if self._level:
+            # round at full resolution, then coarsen, see pyramid().
+            fine = real_to_grid(id, self.scale/2**self._level)
+            return type(fine)(fine[0] >> self._level, fine[1] >> self._level, *fine[2:])
         return real_to_grid(id, self.scale)
 
     def grid_to_real(self, id:GridLocation) -> RealLocation:
@@ -245,8 +743,233 @@ class SignedDistanceGrid:
         '''
         return grid_to_real(id, self.scale)
 
+    def real_to_grid_batch(self, points:ArrayLike) -> np.ndarray:
+        '''Convert an array of real coordinates to grid coordinates.
+
+        See :func:`real_to_grid_batch`.
+        '''
+        if self._level:
+            fine = real_to_grid_batch(points, self.scale/2**self._level)
+            fine[..., :2] //= 2**self._level
+            return fine
+        return real_to_grid_batch(points, self.scale)
+
+    def grid_to_real_batch(self, points:ArrayLike) -> np.ndarray:
+        '''Convert an array of grid coordinates to real coordinates.
+
+        See :func:`grid_to_real_batch`.
+        '''
+        return grid_to_real_batch(points, self.scale)
+
+    def _bilinear(self, points:ArrayLike) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        '''Corner values and fractional offsets for bilinear interpolation at real `points`.
+
+        Cell values are taken at cell centres, i.e. at :meth:`grid_to_real` of the cell,
+        and points outside the centres of the border cells are clamped onto them. Returns ``(v, fx, fy, clamped)`` where `v`
+        is (4, N) holding the top-left, top-right, bottom-left and bottom-right values
+        and `clamped` is (2, N), True where x or y was clamped.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, np.shape(points)[-1])
+        grid = np.asarray(self._grid)
+        u = real_to_grid_exact_batch(points, self.scale)
+        hi = np.array([self.width - 1, self.height - 1], dtype=float)
+        clamped = (u < 0) | (u > hi)
+        u = np.clip(u, 0, hi)
+        i = np.minimum(u.astype(np.intp), np.maximum(hi.astype(np.intp) - 1, 0))
+        f = u - i
+        x0, y0 = i[:, 0], i[:, 1]
+        x1 = np.minimum(x0 + 1, self.width - 1)
+        y1 = np.minimum(y0 + 1, self.height - 1)
+        v = np.stack([grid[y0, x0], grid[y0, x1], grid[y1, x0], grid[y1, x1]]) - self.offset
+        return v, f[:, 0], f[:, 1], clamped.T
+
+    def sample(self, points:ArrayLike) -> np.ndarray:
+        '''Signed distance at real locations, bilinearly interpolated between cells.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            (N,2) array of real locations (extra columns, e.g. heading, are ignored).
+
+        Returns
+        -------
+        np.ndarray
+            (N,) signed distances in real units.
+        '''
+        v, fx, fy, _ = self._bilinear(points)
+        top = v[0] + (v[1] - v[0])*fx
+        bottom = v[2] + (v[3] - v[2])*fx
+        return (top + (bottom - top)*fy)*self.scale
+
+    def gradient(self, points:ArrayLike) -> np.ndarray:
+        '''Gradient of :meth:`sample` at real locations.
+
+        The gradient points away from the nearest obstacle, with a norm close to 1. It is
+        zero along an axis where a point lies beyond the border cells.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            (N,2) array of real locations (extra columns, e.g. heading, are ignored).
+
+        Returns
+        -------
+        np.ndarray
+            (N,2) array of (d/dx, d/dy).
+        '''
+        v, fx, fy, clamped = self._bilinear(points)
+        dx = (v[1] - v[0])*(1 - fy) + (v[3] - v[2])*fy
+        dy = (v[2] - v[0])*(1 - fx) + (v[3] - v[1])*fx
+        return np.where(clamped.T, 0.0, np.stack([dx, dy], axis=1))
+
+    def check_paths(self, paths:ArrayLike, radius:float=0.0, step:Optional[float]=None) -> Tuple[np.ndarray, np.ndarray]:
+        '''Collision check of a disc footprint swept along many polylines at once.
+
+        Every segment is sampled at most `step` apart and the samples are checked with
+        :meth:`sample` in one vectorized lookup. A sample collides when its clearance,
+        the signed distance minus `radius`, is not positive.
+
+        Parameters
+        ----------
+        paths : ArrayLike
+            (M,K,2) array of M polylines (or sampled trajectories) of K real locations
+            each. Pad shorter polylines by repeating their last location.
+        radius : float
+            Footprint radius in real units. Use 0 on a map already :meth:`dilated` by
+            the robot radius.
+        step : float, optional
+            Maximum sample spacing in real units, half a cell by default.
+
+        Returns
+        -------
+        first_collision : np.ndarray
+            (M,) int index of the first segment (vertex index k for the segment from
+            vertex k to k+1, or K-1 for the last vertex) that collides, -1 if none.
+        min_clearance : np.ndarray
+            (M,) smallest clearance along each polyline, in real units.
+        '''
+        paths = np.asarray(paths, dtype=float)[..., :2]
+        m, k = paths.shape[:2]
+        if step is None:
+            step = 0.5*self.scale
+
+        seg = paths[:, 1:] - paths[:, :-1]
+        n = max(int(np.ceil(np.max(np.linalg.norm(seg, axis=-1), initial=0.0)/step)), 1)
+        t = np.arange(n)/n
+        # (M, K-1, n, 2) samples along each segment, end point excluded, then the last vertex.
+        samples = paths[:, :-1, None, :] + seg[:, :, None, :]*t[:, None]
+        clearance = np.empty((m, k, n))
+        clearance[:, :-1] = self.sample(samples.reshape(-1, 2)).reshape(m, k - 1, n) - radius
+        clearance[:, -1] = (self.sample(paths[:, -1]) - radius)[:, None]
+
+        per_segment = clearance.min(axis=2)
+        colliding = per_segment <= 0
+        first_collision = np.where(colliding.any(axis=1), colliding.argmax(axis=1), -1)
+        return first_collision, per_segment.min(axis=1)
+
+    def update_obstacles(self, origin:GridLocation, occupied:ArrayLike):
+        '''Add or clear obstacles in a rectangular region and update the distances in place.
+
+        Only a window around the region is recomputed: cells farther from it than the
+        largest distance found around it cannot have their nearest obstacle (or free
+        cell) inside it. The edit is shared with all dilated views of this grid, and
+        bumps :attr:`version`, which drops the cached lookup tables. A read-only grid
+        (e.g. from :meth:`from_bytes`) is copied on the first edit.
+
+        Parameters
+        ----------
+        origin : GridLocation
+            Grid location of the top-left cell of the region.
+        occupied : ArrayLike
+            (h, w) boolean array, True for obstacle cells and False for free cells.
+            Parts outside the map are ignored. Obstacles are the undilated ones.
+        '''
+        occupied = np.asarray(occupied, dtype=bool)
+        grid = self._grid
+        x0, y0 = max(origin[0], 0), max(origin[1], 0)
+        x1 = min(origin[0] + occupied.shape[1], self.width)
+        y1 = min(origin[1] + occupied.shape[0], self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        patch = occupied[y0 - origin[1]:y1 - origin[1], x0 - origin[0]:x1 - origin[0]]
+        if np.array_equal(grid[y0:y1, x0:x1] <= 0, patch):
+            return
+
+        def window(r:int) -> Tuple[slice, slice]:
+            return (slice(max(y0 - r, 0), min(y1 + r, self.height)), slice(max(x0 - r, 0), min(x1 + r, self.width)))
+
+        whole = (slice(0, self.height), slice(0, self.width))
+
+        # influence radius: distances change at most this far from the region, as they
+        # vary by at most one per cell (plus slack for the jump at obstacle borders).
+        r = int(np.ceil(np.abs(grid[y0:y1, x0:x1]).max())) + 2
+        while window(r) != whole:
+            r_next = int(np.ceil(np.abs(grid[window(r)]).max())) + 2
+            if r_next <= r:
+                break
+            r = r_next
+        inner = window(r)
+
+        # recompute inside `inner` from the occupancy of a margin around it, widening the
+        # margin until every cell's nearest feature provably lies within it.
+        margin = r
+        while True:
+            outer = window(r + margin)
+            occ = grid[outer] <= 0
+            occ[y0 - outer[0].start:y1 - outer[0].start, x0 - outer[1].start:x1 - outer[1].start] = patch
+            sdf = distance_transform_edt(~occ) - distance_transform_edt(occ)
+            values = sdf[inner[0].start - outer[0].start:inner[0].stop - outer[0].start,
+                         inner[1].start - outer[1].start:inner[1].stop - outer[1].start]
+            if outer == whole or (occ.any() and not occ.all() and np.abs(values).max() < margin):
+                break
+            margin *= 2
+
+        if not grid.flags.writeable:
+            grid = self._shared['grid'] = grid.copy()
+        grid[inner] = values
+        self._shared['version'] += 1
+
+    def pyramid(self, level:int) -> 'SignedDistanceGrid':
+        '''Downsampled copy of the grid, halving the resolution `level` times.
+
+        Every coarse cell takes the smallest signed distance of the 2**level by 2**level
+        fine cells it covers (min-pooling), so it is passable only if all of them are,
+        and its clearance never exceeds theirs. The scale doubles with every level.
+        :meth:`real_to_grid` of a coarse grid rounds at the full resolution first and
+        returns the coarse cell covering that fine cell ``(x, y)``, i.e.
+        ``(x >> level, y >> level)``. Levels are built lazily from the previous one and
+        cached; dilation offsets carry over.
+
+        Parameters
+        ----------
+        level : int
+            Number of halvings, 0 returns this grid.
+
+        Returns
+        -------
+        SignedDistanceGrid
+            Grid of ``ceil(width / 2**level)`` by ``ceil(height / 2**level)`` cells.
+        '''
+        if level == 0:
+            return self
+
+        def build():
+            finer = np.asarray(self._grid) if level == 1 else self.pyramid(level - 1)._grid
+            h, w = finer.shape
+            padded = np.pad(finer, ((0, h % 2), (0, w % 2)), constant_values=np.inf)
+            # halve the values, as grid units double in size.
+            pooled = padded.reshape(-(-h // 2), 2, -(-w // 2), 2).min(axis=(1, 3))/2
+            coarse = SignedDistanceGrid(grid=pooled, scale=self.scale*2**level, offset=self.offset/2**level)
+            coarse._level = self._level + level
+            return coarse
+
+        return self._cached(('pyramid', level), build)
+
     def dilated(self, distance:float):
         '''Dilate obstacles in the grid in the north, south, east and west directions by `distance`.
+
+        The result is a view sharing this grid's distance array, so it takes no time or
+        memory to create; only its lookup tables are built on demand.
         
         Parameters
         ----------
@@ -259,11 +982,21 @@ class SignedDistanceGrid:
             Grid with dilated obstacles.
         '''
         grid_distance = distance / self.scale
-        grid = self.grid - grid_distance
-        return SignedDistanceGrid(grid=grid, scale=self.scale)
+        map_ = SignedDistanceGrid(grid=self._grid, scale=self.scale, offset=self.offset + grid_distance)
+        map_._artifact_dir = self._artifact_dir
+        map_._shared = self._shared
+        map_._level = self._level
+        return map_
 
 #### Helper functions ####
 
+def _save_artifact(path:str, array:np.ndarray):
+    '''Save `array` to the ``.npy`` file `path` atomically, so readers never see a partial file.'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path[:-4]}.{os.getpid()}.tmp.npy'
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
 def euclidean_distance(a:Union[RealLocation, RealPose], b:Union[RealLocation, RealPose]) -> float:
     '''Compute the Euclidean distance between points.
     
@@ -347,3 +1080,68 @@ def grid_to_real(id:Union[GridLocation, GridPose], scale:float) -> Union[RealLoc
         return RealPose(id[0]*scale, id[1]*scale, id[2])
     return RealLocation(id[0]*scale, id[1]*scale)
 
+
+
+def real_to_grid_batch(points:ArrayLike, scale:float) -> np.ndarray:
+    '''Convert an array of real coordinates to grid coordinates.
+
+    Vectorized version of :func:`real_to_grid` with identical rounding.
+
+    Parameters
+    ----------
+    points
+        (N,2) array of locations or (N,3) array of poses.
+    scale
+        Ratio of real-world unit to grid unit.
+
+    Returns
+    -------
+    np.ndarray
+        (N,2) int array of grid locations, or (N,3) float array of grid poses
+        whose x and y columns hold whole numbers and heading is unchanged.
+    '''
+    points = np.asarray(points, dtype=float)
+    xy = np.trunc(np.round(points[..., :2]/scale, 2))
+    if points.shape[-1] == 3:
+        return np.concatenate([xy, points[..., 2:]], axis=-1)
+    return xy.astype(np.int64)
+
+def real_to_grid_exact_batch(points:ArrayLike, scale:float) -> np.ndarray:
+    '''Convert an array of real coordinates to grid coordinates without discretization.
+
+    Vectorized version of :func:`real_to_grid_exact`.
+
+    Parameters
+    ----------
+    points
+        (N,2) array of locations.
+    scale
+        Ratio of real-world unit to grid unit.
+
+    Returns
+    -------
+    np.ndarray
+        (N,2) float array of grid locations.
+    '''
+    return np.asarray(points, dtype=float)[..., :2]/scale
+
+def grid_to_real_batch(points:ArrayLike, scale:float) -> np.ndarray:
+    '''Convert an array of grid coordinates to real coordinates.
+
+    Vectorized version of :func:`grid_to_real`.
+
+    Parameters
+    ----------
+    points
+        (N,2) array of locations or (N,3) array of poses.
+    scale
+        Ratio of real-world unit to grid unit.
+
+    Returns
+    -------
+    np.ndarray
+        (N,2) or (N,3) float array. Heading of poses is unchanged.
+    '''
+    points = np.array(points, dtype=float)
+    points[..., :2] *= scale
+    return points
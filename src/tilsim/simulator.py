@@ -46,18 +46,39 @@ app = flask.Flask(__name__)
 
 ##### Simulated Localisation #####
 
+# Map responses, built on first request. The map file does not change while running.
+map_responses = {}
+map_responses_lock = Lock()
+
 @app.route('/map', methods=['GET'])
 def get_map():
-    f = open(sim_config.map_file, 'rb')
-    grid = f.read()
-    f.close()
-    
-    return {
-        'map': {
-            'scale': sim_config.map_scale,
-            'grid': base64.encodebytes(grid).decode('utf-8')
-        }
-    }
+    with map_responses_lock:
+        if 'image' not in map_responses:
+            grid = Path(sim_config.map_file).read_bytes()
+            map_responses['image'] = {
+                'map': {
+                    'scale': sim_config.map_scale,
+                    'grid': base64.encodebytes(grid).decode('utf-8')
+                }
+            }
+    return map_responses['image']
+
+@app.route('/map/sdf', methods=['GET'])
+def get_map_sdf():
+    '''Signed distance grid of the map in the binary format of SignedDistanceGrid.to_bytes.
+
+    Query parameter `dtype` selects float32 (default) or int16.
+    '''
+    dtype = flask.request.args.get('dtype', 'float32')
+    if dtype not in ('float32', 'int16'):
+        return 'Bad request.', 400
+
+    with map_responses_lock:
+        if dtype not in map_responses:
+            if 'sdf' not in map_responses:
+                map_responses['sdf'] = SignedDistanceGrid.from_image(plt.imread(sim_config.map_file), sim_config.map_scale)
+            map_responses[dtype] = map_responses['sdf'].to_bytes(np.dtype(dtype))
+    return flask.Response(map_responses[dtype], mimetype='application/octet-stream')
 
 @app.route('/pose', methods=['GET'])
 def get_pose():
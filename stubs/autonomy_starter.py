@@ -5,6 +5,7 @@
 # "stubs" folder. You do not need to modify the "src" folder. Have fun!
 
 import argparse
+from collections import deque
 from datetime import datetime
 import logging
 import os
@@ -21,7 +22,7 @@ from tilsdk.utilities import PIDController, SimpleMovingAverage     # import opt
 from tilsdk.reporting import save_zip                               # to handle embedded zip file in flask response
 
 # Import your code
-from planner import Planner
+from planner import Planner, CheckpointPathCache
 from planner import InvalidStartException, NoPathFoundException    # Exceptions for path planning.
 
 # Setup logging in a nice readable format
@@ -104,10 +105,18 @@ def get_pose(loc_service, pose_filter):
 
     return pose_filter.update(pose)
 
-def plan_path(planner, start: list, goal):
+def plan_path(planner, start: list, goal, robot, path_cache=None):
     current_coord = RealLocation(x=start[0], y=start[1])
-    path = planner.plan(current_coord, goal)
-    return path
+    path = path_cache.get(current_coord, goal) if path_cache else None  # precomputed checkpoint-to-checkpoint path.
+    if path is None:
+        future = planner.plan_async(current_coord, goal)
+        while not future.done():
+            # keep commanding the robot while planning runs in the background, so it
+            # holds still instead of coasting on its last velocity command.
+            robot.chassis.drive_speed(x=0.0, y=0.0, z=0.0)
+            time.sleep(0.1)
+        path = future.result()
+    return deque(path)  # waypoints are consumed from the front.
 
 def ang_difference(ang1, ang2):
     '''Get angular difference in degrees of two angles in degrees, 
@@ -152,10 +161,10 @@ def main():
     robot.set_robot_mode(mode="chassis_lead")
     
     # === Initialize planner ===
-    map_:SignedDistanceGrid = loc_service.get_map()
+    map_:SignedDistanceGrid = loc_service.get_map(cache_dir=MAP_CACHE_DIR or None)
     map_ = map_.dilated(ROBOT_RADIUS_M) # dilate obstacles virtually so that planner avoids
                                         # bringing robot too close to real obstacles.
-    planner = Planner(map_, sdf_weight=0.5)
+    planner = Planner(map_, sdf_weight=0.5, shortcut_clearance=PATH_CLEARANCE_M)  # collapse grid path into few waypoints.
 
     # === Initialize movement controller === 
     controller = PIDController(Kp=(0.5, 0.20), Ki=(0.2, 0.1), Kd=(0.0, 0.0))  # this can be tuned.
@@ -189,6 +198,11 @@ def main():
         pose = loc_service.get_pose()  # TODO: remove `clues`.
         time.sleep(0.25)
         pose = pose_filter.update(pose)
+
+    # Precompute paths between the known checkpoints in the background.
+    checkpoints = [RealLocation(x=pose[0], y=pose[1]), new_loi] + CANDIDATE_GOALS
+    path_cache = CheckpointPathCache(planner, checkpoints, tolerance=REACHED_THRESHOLD_M)
+    path_cache.start()
     
     logging.getLogger('Main').info(f">>>>> Autobot rolling out! <<<<<")
 
@@ -310,10 +324,10 @@ def main():
         curr_wp = None
         
         try:
-            path = plan_path(planner, last_valid_pose, curr_loi)  ## Ensure only valid start positions are passed to the planner.
+            path = plan_path(planner, last_valid_pose, curr_loi, robot, path_cache)  ## Ensure only valid start positions are passed to the planner.
         except InvalidStartException as e:
             logging.getLogger('Navigation').warn(f"{e}")
-            # TODO: find and use another valid start point.
+            # the planner already snaps invalid starts, so this only happens without any passable cell.
             return
         logging.getLogger('Main').info('Path planned.')
         # TODO: abstract the path planning and movement code to functions.
@@ -369,7 +383,7 @@ def main():
                 
                 dist_to_wp = euclidean_distance(real_location, curr_wp)
                 if round(dist_to_wp, 2) < REACHED_THRESHOLD_M:
-                    path = path[1:] # remove the nearest waypoint.
+                    path.popleft() # remove the nearest waypoint.
                     controller.reset()
                     curr_wp = path[0]
                     continue  # start navigating to next waypoint.         
@@ -435,11 +449,14 @@ if __name__ == '__main__':
         REACHED_THRESHOLD_M = cfg['REACHED_THRESHOLD_M']
         ANGLE_THRESHOLD_DEG = cfg['ANGLE_THRESHOLD_DEG']
         ROBOT_RADIUS_M = cfg['ROBOT_RADIUS_M']
+        PATH_CLEARANCE_M = cfg['PATH_CLEARANCE_M']
+        CANDIDATE_GOALS = [RealLocation(x=g[0], y=g[1]) for g in cfg['CANDIDATE_GOALS']]
         NLP_MODEL_DIR =  cfg['NLP_MODEL_DIR']
         CV_MODEL_DIR = cfg['CV_MODEL_DIR']
         REID_MODEL_DIR = cfg['REID_MODEL_DIR']
         SPEAKER_ID_MODEL_DIR = cfg['SPEAKER_ID_MODEL_DIR']
         PHOTO_DIR = cfg['PHOTO_DIR']
+        MAP_CACHE_DIR = cfg['MAP_CACHE_DIR']
 
         STUCK_THRESHOLD = cfg['STUCK_THRESHOLD']  # number of iterations to consider robot as stuck on one waypoint.
 
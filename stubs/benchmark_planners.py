@@ -0,0 +1,100 @@
+"""
+Compare the path planners in planner.py on a map image: wall time, path length,
+waypoint count and node expansions.
+
+Example:
+    python stubs/benchmark_planners.py --map data/maps/map_complex_1cm.png --pairs 10
+"""
+
+import argparse
+import math
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from tilsdk.localization import *
+
+from planner import Planner, ThetaStarPlanner, JumpPointPlanner, HierarchicalPlanner, BidirectionalPlanner
+from planner import AnytimePlanner, LandmarkPlanner, RoadmapPlanner
+from planner import NoPathFoundException
+
+
+PLANNERS = {
+    'astar': Planner,
+    'theta*': ThetaStarPlanner,
+    'jps': JumpPointPlanner,
+    'hpa*': HierarchicalPlanner,
+    'bi-astar': BidirectionalPlanner,
+    'ara*': AnytimePlanner,
+    'alt': LandmarkPlanner,
+    'roadmap': RoadmapPlanner,
+}
+
+
+def random_pairs(map_:SignedDistanceGrid, n:int, seed:int=0):
+    '''Sample `n` start/goal pairs of passable cells.'''
+    rng = np.random.default_rng(seed)
+    ys, xs = np.nonzero(map_.passable_mask())
+    picks = rng.choice(len(xs), size=(n, 2), replace=False)
+    return [(GridLocation(int(xs[a]), int(ys[a])), GridLocation(int(xs[b]), int(ys[b]))) for a, b in picks]
+
+
+def path_length(start:GridLocation, path):
+    '''Length of a grid path in cells, start included.'''
+    points = [start, *path]
+    return sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(points, points[1:]))
+
+
+def run(planner:Planner, pairs):
+    '''Plan every pair and collect timing and path statistics.'''
+    # warm up the map's lookup tables and any per-map precomputation (e.g. the HPA*
+    # abstraction) so they are not billed to the first query.
+    try:
+        planner.plan_grid(*pairs[0])
+    except NoPathFoundException:
+        pass
+
+    times, lengths, waypoints, expansions, failed = [], [], [], [], 0
+    for start, goal in pairs:
+        t = time.perf_counter()
+        try:
+            path = planner.plan_grid(start, goal)
+        except NoPathFoundException:
+            failed += 1
+            continue
+        times.append(time.perf_counter() - t)
+        lengths.append(path_length(start, path))
+        waypoints.append(len(path))
+        expansions.append(planner.expansions)
+    return {
+        'time_s': np.mean(times) if times else float('nan'),
+        'length_m': np.mean(lengths)*planner.map.scale if lengths else float('nan'),
+        'waypoints': np.mean(waypoints) if waypoints else float('nan'),
+        'expansions': np.mean(expansions) if expansions else float('nan'),
+        'failed': failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark path planners on a map image.')
+    parser.add_argument('--map', type=str, default='data/maps/map_complex_1cm.png', help='Map image filename.')
+    parser.add_argument('--scale', type=float, default=0.01, help='Map scale, i.e. ratio of real-world unit to grid/px unit.')
+    parser.add_argument('--robot_radius', type=float, default=0.17, help='Obstacle dilation in real units.')
+    parser.add_argument('--sdf_weight', type=float, default=0.5, help='Relative weight of distance in cost function.')
+    parser.add_argument('--pairs', type=int, default=10, help='Number of random start/goal pairs.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for start/goal pairs.')
+    parser.add_argument('--planners', type=str, nargs='+', default=list(PLANNERS), choices=list(PLANNERS))
+    args = parser.parse_args()
+
+    map_ = SignedDistanceGrid.from_image(plt.imread(args.map), args.scale).dilated(args.robot_radius)
+    pairs = random_pairs(map_, args.pairs, args.seed)
+
+    print(f"{'planner':<12}{'time (s)':>10}{'length (m)':>12}{'waypoints':>11}{'expansions':>12}{'failed':>8}")
+    for name in args.planners:
+        stats = run(PLANNERS[name](map_, sdf_weight=args.sdf_weight), pairs)
+        print(f"{name:<12}{stats['time_s']:>10.3f}{stats['length_m']:>12.3f}{stats['waypoints']:>11.1f}{stats['expansions']:>12.0f}{stats['failed']:>8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,22 @@
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 import heapq
-from typing import List, Tuple, TypeVar, Dict
+import logging
+import math
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
 
 from tilsdk.localization import *
 
 
 T = TypeVar('T')
 
+
 class NoPathFoundException(Exception):
     '''Raise this exception when the pathfinding algorithm cannot reach the endpoint from the startpoint.
     '''
@@ -17,6 +28,67 @@ class InvalidStartException(NoPathFoundException):
     '''
     pass
 
+class UnreachableGoalException(NoPathFoundException):
+    '''This is a more specific NoPathFoundException arising from a valid goal in another connected
+    region of the map than the start. It is raised before any search, and `nearest` holds the cell
+    reachable from the start that is closest to the goal.
+    '''
+    def __init__(self, nearest:GridLocation):
+        super().__init__(f'Goal is not reachable from start, nearest reachable cell is {nearest}.')
+        self.nearest = nearest
+
+
+def shortcut_path(map_:SignedDistanceGrid, start:GridLocation, path:List[GridLocation],
+                  min_clearance:float=0.0) -> Tuple[List[GridLocation], int]:
+    '''Collapse a grid path into the fewest waypoints with clear line of sight.
+
+    From each kept waypoint, the furthest later waypoint still visible with
+    `min_clearance` (see :meth:`SignedDistanceGrid.line_of_sight`) is found by a
+    galloping then binary search and becomes the next kept waypoint. The goal is
+    always kept, and where the grid path itself passes closer than `min_clearance`
+    its original waypoints are kept.
+
+    Parameters
+    ----------
+    map_ : SignedDistanceGrid
+        Map used for line-of-sight checks.
+    start : GridLocation
+        Start location the path leads away from (not part of `path`).
+    path : List[GridLocation]
+        Waypoints from start to goal, as returned by :meth:`Planner.plan_grid`.
+    min_clearance : float
+        Minimum distance to obstacles along shortcuts, in **real** units.
+
+    Returns
+    -------
+    path
+        Decimated list of waypoints, start still excluded.
+    removed
+        Number of waypoints removed.
+    '''
+    points = [start, *path]
+    last = len(points) - 1
+    shortcut: List[GridLocation] = []
+
+    i = 0
+    while i < last:
+        # neighbouring waypoints always see each other, so i + 1 is a valid fallback.
+        visible, k = i + 1, 2
+        while i + k <= last and map_.line_of_sight(points[i], points[i + k], min_clearance):
+            visible = i + k
+            k *= 2
+        blocked = min(i + k, last + 1)
+        while blocked - visible > 1:
+            mid = (visible + blocked) // 2
+            if map_.line_of_sight(points[i], points[mid], min_clearance):
+                visible = mid
+            else:
+                blocked = mid
+        shortcut.append(points[visible])
+        i = visible
+
+    return shortcut, len(path) - len(shortcut)
+
 
 class PriorityQueue:
     # A priority queue where the smaller the value, the higher the priority.
@@ -34,7 +106,8 @@ class PriorityQueue:
 
 
 class Planner:
-    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0):
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, shortcut_clearance:Optional[float]=None,
+                 path_cache_size:int=32, snap_endpoints:bool=True):
         '''
         Parameters
         ----------
@@ -42,13 +115,38 @@ class Planner:
             Distance grid map
         sdf_weight: float
             Relative weight of distance in cost function.
+        shortcut_clearance: float, optional
+            If set, :meth:`plan` collapses the grid path with :func:`shortcut_path`,
+            keeping this minimum clearance (real units) along shortcuts.
+        path_cache_size: int
+            Number of recent :meth:`plan` results to keep. 0 disables the cache.
+        snap_endpoints: bool
+            If True, :meth:`plan` moves a start or goal that is off-map or in an
+            obstacle to the nearest passable cell instead of failing.
         '''
         self.map = map_
         self.sdf_weight = sdf_weight
+        self.shortcut_clearance = shortcut_clearance
+        self.snap_endpoints = snap_endpoints
+        self.expansions = 0
+        '''Number of cells expanded by the last :meth:`plan_grid` call.'''
+
+        # LRU cache of plan() results, keyed by map fingerprint, grid start/goal and settings.
+        self.path_cache_size = path_cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._path_cache: OrderedDict = OrderedDict()
+
+        # background planning, see plan_async().
+        self._executor = None
+        self._pending: Optional[Future] = None
+        self._cancel = Event()
+        self._async_lock = Lock()
 
     def update_map(self, map:SignedDistanceGrid):
         '''Update planner with new map.'''
         self.map = map
+        self._path_cache.clear()
 
     def heuristic(self, a:GridLocation, b:GridLocation) -> float:
         '''heuristic function for A* pathfinding.
@@ -65,7 +163,11 @@ class Planner:
     def plan(self, start:RealLocation, goal:RealLocation) -> List[RealLocation]:
         '''Plan in real coordinates.
         
-        Raises NoPathFileException path is not found.
+        Raises NoPathFileException path is not found. Results are kept in a small LRU
+        cache (see `path_cache_size`), so repeating a query from the same start cell to
+        the same goal cell on the same map returns immediately. With `snap_endpoints`,
+        an invalid start or goal is replaced by the nearest passable cell; a snapped
+        start becomes the first waypoint, so the robot leaves the obstacle first.
 
         Parameters
         ----------
@@ -80,8 +182,97 @@ class Planner:
             List of RealLocation from start to goal.
         '''
         print(f"[PLANNER] START:{start.x:.2f},{start.y:.2f}; GOAL: {goal.x:.2f},{goal.y:.2f}")
-        path = self.plan_grid(self.map.real_to_grid(start), self.map.real_to_grid(goal))
-        return [self.map.grid_to_real(wp) for wp in path]
+        grid_start, grid_goal = self.map.real_to_grid(start), self.map.real_to_grid(goal)
+
+        key = (self.map.fingerprint(), grid_start, grid_goal, self.sdf_weight, self.shortcut_clearance)
+        if self.path_cache_size > 0:
+            cached = self._path_cache.get(key)
+            if cached is not None:
+                self.cache_hits += 1
+                self._path_cache.move_to_end(key)
+                return list(cached)
+            self.cache_misses += 1
+
+        path = self._finish_path(grid_start, self._plan_snapped(grid_start, grid_goal))
+
+        if self.path_cache_size > 0:
+            self._path_cache[key] = path
+            while len(self._path_cache) > self.path_cache_size:
+                self._path_cache.popitem(last=False)
+        return list(path)
+
+    def plan_async(self, start:RealLocation, goal:RealLocation) -> Future:
+        '''Plan in real coordinates in a background thread.
+
+        Requests run one at a time on a single worker thread. A new request cancels the
+        previous one if it is still queued or running; a running search notices within
+        a few thousand expansions and its future raises
+        :class:`concurrent.futures.CancelledError`.
+
+        Do not call :meth:`plan` from other threads while a request is running, as
+        planners keep per-map state.
+
+        Parameters
+        ----------
+        start: RealLocation
+            Starting location.
+        goal: RealLocation
+            Goal location.
+
+        Returns
+        -------
+        future
+            Future resolving to the same result as :meth:`plan` (path or exception).
+        '''
+        with self._async_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Planner')
+            if self._pending is not None and not self._pending.cancel():
+                self._cancel.set()  # already running, ask the search to stop.
+            self._pending = self._executor.submit(self._plan_job, start, goal)
+            return self._pending
+
+    def _plan_job(self, start:RealLocation, goal:RealLocation) -> List[RealLocation]:
+        # the single worker only starts this job once the previous one has stopped.
+        self._cancel.clear()
+        return self.plan(start, goal)
+
+    def _check_cancelled(self):
+        '''Raise CancelledError if a newer :meth:`plan_async` request superseded this one.'''
+        if self._cancel.is_set():
+            raise CancelledError
+
+    def _snap(self, id:GridLocation) -> GridLocation:
+        '''Nearest passable cell to `id` if snapping is enabled and `id` is not valid.'''
+        if not self.snap_endpoints or not self.map or self.is_valid_position(id):
+            return id
+        snapped = self.map.nearest_passable(id)
+        if snapped is None:
+            return id
+        logging.getLogger('Planner').info(f"Snapped {tuple(id)} to nearest passable cell {tuple(snapped)}.")
+        return snapped
+
+    def _plan_snapped(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        ''':meth:`plan_grid` with start and goal snapped to passable cells, see `snap_endpoints`.'''
+        snapped_start = self._snap(start)
+        path = self.plan_grid(snapped_start, self._snap(goal))
+        if snapped_start != start:
+            path = [snapped_start] + path
+        return path
+
+    def _finish_path(self, grid_start:GridLocation, path:List[GridLocation]) -> List[RealLocation]:
+        '''Post-process a grid path from :meth:`plan_grid` into the output of :meth:`plan`.'''
+        if self.shortcut_clearance is not None:
+            path, removed = shortcut_path(self.map, grid_start, path, self.shortcut_clearance)
+            logging.getLogger('Planner').info(f"Shortcutting removed {removed} waypoints, {len(path)} left.")
+        return self.to_real_path(path)
+
+    def to_real_path(self, path:List[GridLocation]) -> List[RealLocation]:
+        '''Convert a grid path to real coordinates in one vectorized call.'''
+        if not path:
+            return []
+        real = self.map.grid_to_real_batch(np.asarray(path))
+        return [RealLocation(x, y) for x, y in real.tolist()]
     
     
     def is_valid_position(self, start: GridLocation):
@@ -97,6 +288,11 @@ class Planner:
     def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
         '''Plan in grid coordinates.
 
+        The search works on flat cell indices (``y*width + x``) with preallocated
+        cost, parent and closed arrays, so no per-cell tuples or dicts are created.
+        Neighbours and step costs come from the lookup tables cached on the map
+        (see :meth:`SignedDistanceGrid.neighbour_mask`).
+
         Parameters
         ----------
         start: GridLocation
@@ -114,44 +310,122 @@ class Planner:
         NoPathFoundException
             When there is no path from `start` to `goal` and no InvalidStartException.
         InvalidStartException
-            When 
+            When `start` is off-map or in an obstacle.
+        UnreachableGoalException
+            When `goal` is valid but not connected to `start`.
         
         '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        return self._astar(start_idx, goal_idx, self.map.traversal_cost(self.sdf_weight))
+
+    def _check_endpoints(self, start:GridLocation, goal:GridLocation) -> Tuple[int, int]:
+        '''Validate a query and return the flat indices of `start` and `goal`.
 
+        Unreachable goals are detected in constant time from the map's connected
+        components, so searches never flood the map just to find out.
+        '''
         if not self.map:
             raise RuntimeError('Planner map is not initialized.')
-        
+
         if not self.is_valid_position(start):
             raise InvalidStartException
 
-        frontier = PriorityQueue()
-        frontier.put(start, 0)
-        came_from: Dict[GridLocation, GridLocation] = {}
-        cost_so_far: Dict[GridLocation, float] = {}
-        came_from[start] = None
-        cost_so_far[start] = 0
+        if not self.is_valid_position(goal):
+            raise NoPathFoundException
+
+        labels = self.map.component_labels()
+        if labels[start[1], start[0]] != labels[goal[1], goal[0]]:
+            raise UnreachableGoalException(self.nearest_reachable(start, goal))
+
+        width = self.map.width
+        return start[1]*width + start[0], goal[1]*width + goal[0]
+
+    def nearest_reachable(self, start:GridLocation, goal:GridLocation) -> GridLocation:
+        '''Cell reachable from `start` that is closest to `goal` (euclidean).
+
+        `start` must be a valid position. Returns `goal` itself if it is reachable.
+        '''
+        return self.map.nearest_in_component(goal, self.map.component_labels()[start[1], start[0]])
+
+    def _astar(self, start_idx:int, goal_idx:int, cell_cost:np.ndarray,
+               heuristic:Optional[np.ndarray]=None) -> List[GridLocation]:
+        '''A* search between flat cells, given the cost of entering each cell.
+
+        Cells with infinite `cell_cost` are never entered, which lets callers restrict
+        the search to part of the map. `heuristic` optionally gives an admissible
+        cost-to-goal estimate per flat cell, replacing the euclidean distance. Raises
+        NoPathFoundException if `goal_idx` cannot be reached.
+        '''
+        width = self.map.width
+        gy, gx = divmod(goal_idx, width)
+
+        # Per-map tables, built once by the grid and shared by every call.
+        neighbour_mask = self.map.neighbour_mask()
+        moves = self.map.neighbour_offsets()
+
+        cost_so_far = np.full(cell_cost.size, np.inf)
+        came_from = np.full(cell_cost.size, -1, dtype=np.int64)
+        closed = np.zeros(cell_cost.size, dtype=np.uint8)
 
-        while not frontier.is_empty():
-            current: GridLocation = frontier.get()
+        # memoryviews give fast scalar access to the numpy buffers from python.
+        cell_, mask_, cost_, came_, closed_ = (
+            memoryview(a) for a in (cell_cost, neighbour_mask, cost_so_far, came_from, closed))
+        h_ = memoryview(heuristic) if heuristic is not None else None
 
-            if current == goal:
+        cost_[start_idx] = 0.0
+        frontier = [(0.0, start_idx)]
+        heappop, heappush, hypot = heapq.heappop, heapq.heappush, math.hypot
+        expansions = 0
+
+        while frontier:
+            _, current = heappop(frontier)
+            if closed_[current]:
+                continue  # stale queue entry.
+            if current == goal_idx:
                 break
+            closed_[current] = 1
+            expansions += 1
+            if not expansions & 4095:
+                self._check_cancelled()
 
-            for next, step_cost, sdf in self.map.neighbours(current):
-                new_cost = cost_so_far[current] + step_cost + self.sdf_weight*(1/(sdf))
-                if next not in cost_so_far or new_cost < cost_so_far[next]:
-                    cost_so_far[next] = new_cost
-                    priority = new_cost + self.heuristic(next, goal)
-                    frontier.put(next, priority)
-                    came_from[next] = current
-            
-            #print(f'came from: {came_from}')
-            #print(f'goal: {goal}')
-        
-        if goal not in came_from:
+            y, x = divmod(current, width)
+            current_cost = cost_[current]
+            for offset, dx, dy, step_cost in moves[mask_[current]]:
+                next = current + offset
+                if closed_[next]:
+                    continue
+                new_cost = current_cost + step_cost + cell_[next]
+                if new_cost < cost_[next]:
+                    cost_[next] = new_cost
+                    came_[next] = current
+                    if h_ is None:
+                        heappush(frontier, (new_cost + hypot(x + dx - gx, y + dy - gy), next))
+                    else:
+                        heappush(frontier, (new_cost + h_[next], next))
+
+        self.expansions = expansions
+        if came_[goal_idx] < 0 and goal_idx != start_idx:
             raise NoPathFoundException
 
-        return self.reconstruct_path(came_from, start, goal)
+        return self._trace_flat_path(came_from, start_idx, goal_idx)
+
+    def _trace_flat_path(self, came_from:np.ndarray, start_idx:int, goal_idx:int) -> List[GridLocation]:
+        '''Traces a flat parent array back from goal to start.
+
+        Like :meth:`reconstruct_path`, the start location is not included.
+        '''
+        width = self.map.width
+        came_ = memoryview(came_from)
+        current = goal_idx
+        path: List[GridLocation] = []
+
+        while current != start_idx:
+            y, x = divmod(current, width)
+            path.append(GridLocation(x, y))
+            current = came_[current]
+
+        path.reverse()
+        return path
 
     def reconstruct_path(self,
                          came_from:Dict[GridLocation, GridLocation],
@@ -182,4 +456,1332 @@ class Planner:
             
         # path.append(start)
         path.reverse()
-        return path
\ No newline at end of file
+        return path
+
+
+class CostToGoPlanner(Planner):
+    '''Planner that answers queries by descending a per-goal cost-to-go field.
+
+    The first query to a goal runs a reverse Dijkstra search from the goal over the whole
+    map (same cost model as :meth:`Planner.plan_grid`, including `sdf_weight`). The
+    resulting field is cached, so replanning to the same goal from any start is a
+    greedy walk down the field taking O(path length). The field is recomputed when the
+    goal, the map or `sdf_weight` changes.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, **kwargs):
+        super().__init__(map_, sdf_weight, **kwargs)
+        self._field = None
+        self._field_key = None
+        self._field_map = None
+
+    def update_map(self, map:SignedDistanceGrid):
+        '''Update planner with new map. Drops the cached cost-to-go field.'''
+        super().update_map(map)
+        self._field = None
+        self._field_key = None
+        self._field_map = None
+
+    def cost_to_go(self, goal:GridLocation) -> np.ndarray:
+        '''Cost-to-go field towards `goal`.
+
+        Parameters
+        ----------
+        goal: GridLocation
+            Goal location.
+
+        Returns
+        -------
+        field
+            Flat (height*width,) array of the cost of the cheapest path from each cell to
+            `goal`, ``inf`` where the goal cannot be reached.
+        '''
+        goal_idx = goal[1]*self.map.width + goal[0]
+        key = (goal_idx, self.sdf_weight)
+        if self._field_key != key or self._field_map != self.map.fingerprint():
+            graph = self.map.transition_graph(self.sdf_weight, reverse=True)
+            self._field = dijkstra(graph, directed=True, indices=goal_idx)
+            self._field_key = key
+            self._field_map = self.map.fingerprint()
+        return self._field
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates by descending the cost-to-go field of `goal`.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        width = self.map.width
+
+        field = self.cost_to_go(goal)
+        if not np.isfinite(field[start_idx]):
+            raise NoPathFoundException
+
+        cell_ = memoryview(self.map.traversal_cost(self.sdf_weight))
+        mask_ = memoryview(self.map.neighbour_mask())
+        field_ = memoryview(field)
+        moves = self.map.neighbour_offsets()
+
+        current = start_idx
+        path: List[GridLocation] = []
+        while current != goal_idx:
+            best, best_cost = -1, np.inf
+            for offset, _, _, step_cost in moves[mask_[current]]:
+                next = current + offset
+                next_cost = step_cost + cell_[next] + field_[next]
+                if next_cost < best_cost:
+                    best, best_cost = next, next_cost
+            current = best
+            y, x = divmod(current, width)
+            path.append(GridLocation(x, y))
+
+        return path
+
+
+class DStarLitePlanner(Planner):
+    '''Incremental planner (D* Lite) that keeps its search state between calls.
+
+    The search runs backwards from the goal and keeps its g/rhs values and priority
+    queue. When the start moves, or :meth:`update_map` changes the cost of some cells,
+    only the affected part of the search is repaired on the next :meth:`plan_grid`
+    call. Changing the goal, map size or `sdf_weight` starts a fresh search.
+
+    Same cost model, path format and exceptions as :class:`Planner`.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, **kwargs):
+        super().__init__(map_, sdf_weight, **kwargs)
+        self._reset()
+
+    def _reset(self):
+        '''Drop all search state.'''
+        self._goal_idx = None
+        self._start_idx = None
+        self._sdf_weight = None
+        self._km = 0.0
+        self._queue: List[Tuple[float, float, int]] = []
+        self._cell_cost = None
+
+    def update_map(self, map:SignedDistanceGrid):
+        '''Update planner with new map.
+
+        If a search is in progress and the map size is unchanged, cells whose cost
+        changed are queued for repair instead of discarding the search.
+        '''
+        old_map = self.map
+        super().update_map(map)
+
+        if (self._goal_idx is None or old_map is None
+                or (map.width, map.height) != (old_map.width, old_map.height)
+                or self._sdf_weight != self.sdf_weight):
+            self._reset()
+            return
+
+        old_cost = self._cell_cost
+        self._bind_tables()
+        changed = np.flatnonzero(self._cell_cost != old_cost)
+
+        for v in changed.tolist():
+            self._update_vertex(v)
+            for offset, _, _, _ in self._moves[self._mask_[v]]:
+                self._update_vertex(v + offset)
+
+    def _bind_tables(self):
+        '''Fetch the map's lookup tables used by the search.'''
+        self._cell_cost = self.map.traversal_cost(self.sdf_weight)
+        self._cell_ = memoryview(self._cell_cost)
+        self._mask_ = memoryview(self.map.neighbour_mask())
+        self._moves = self.map.neighbour_offsets()
+
+    def _initialize(self, start_idx:int, goal_idx:int):
+        '''Start a fresh search towards `goal_idx`.'''
+        self._reset()
+        self._bind_tables()
+        n = self._cell_cost.size
+        self._g = np.full(n, np.inf)
+        self._rhs = np.full(n, np.inf)
+        # key of the live queue entry for each cell, nan if the cell is not queued.
+        self._queued_key = np.full(n, np.nan)
+        self._g_, self._rhs_, self._qk_ = (memoryview(a) for a in (self._g, self._rhs, self._queued_key))
+
+        self._goal_idx = goal_idx
+        self._start_idx = start_idx
+        self._sdf_weight = self.sdf_weight
+        self._rhs_[goal_idx] = 0.0
+        self._push(goal_idx)
+
+    def _key(self, u:int) -> Tuple[float, float]:
+        '''D* Lite priority of cell `u`.'''
+        width = self.map.width
+        uy, ux = divmod(u, width)
+        sy, sx = divmod(self._start_idx, width)
+        m = min(self._g_[u], self._rhs_[u])
+        return (m + math.hypot(ux - sx, uy - sy) + self._km, m)
+
+    def _push(self, u:int):
+        k1, k2 = self._key(u)
+        self._qk_[u] = k1
+        heapq.heappush(self._queue, (k1, k2, u))
+
+    def _update_vertex(self, u:int):
+        '''Recompute rhs of `u` from its successors and fix its queue membership.'''
+        if u != self._goal_idx:
+            rhs = np.inf
+            if self._cell_[u] != np.inf:
+                g_, cell_ = self._g_, self._cell_
+                for offset, _, _, step_cost in self._moves[self._mask_[u]]:
+                    s = u + offset
+                    c = step_cost + cell_[s] + g_[s]
+                    if c < rhs:
+                        rhs = c
+            self._rhs_[u] = rhs
+
+        self._requeue(u)
+
+    def _requeue(self, u:int):
+        '''Queue `u` with a fresh key if it is inconsistent, otherwise drop it from the queue.'''
+        if self._g_[u] != self._rhs_[u]:
+            self._push(u)
+        else:
+            self._qk_[u] = np.nan
+
+    def _compute_shortest_path(self):
+        '''Expand inconsistent cells until the start is consistent.'''
+        queue, g_, rhs_, qk_, cell_, mask_, moves = (
+            self._queue, self._g_, self._rhs_, self._qk_, self._cell_, self._mask_, self._moves)
+        heappop, heappush, hypot, inf, nan = heapq.heappop, heapq.heappush, math.hypot, np.inf, np.nan
+        start, goal, km, width = self._start_idx, self._goal_idx, self._km, self.map.width
+        sy, sx = divmod(start, width)
+
+        while queue:
+            k1, k2, u = queue[0]
+            if qk_[u] != k1:
+                heappop(queue)  # stale entry.
+                continue
+            g_start, rhs_start = g_[start], rhs_[start]
+            start_key = min(g_start, rhs_start) + km
+            if (k1 > start_key or (k1 == start_key and k2 >= min(g_start, rhs_start))) and rhs_start == g_start:
+                break
+            heappop(queue)
+            self.expansions += 1
+            if not self.expansions & 4095:
+                self._check_cancelled()
+
+            g_u, rhs_u = g_[u], rhs_[u]
+            uy, ux = divmod(u, width)
+            m = min(g_u, rhs_u)
+            new_k1 = m + hypot(ux - sx, uy - sy) + km
+            if k1 < new_k1 or (k1 == new_k1 and k2 < m):
+                qk_[u] = new_k1
+                heappush(queue, (new_k1, m, u))
+            elif g_u > rhs_u:
+                g_[u] = rhs_u
+                qk_[u] = nan
+                # predecessors of u are its passable neighbours, as moves are symmetric.
+                enter_u = cell_[u] + rhs_u
+                for offset, dx, dy, step_cost in moves[mask_[u]]:
+                    p = u + offset
+                    c = step_cost + enter_u
+                    if c < rhs_[p] and p != goal:
+                        rhs_[p] = c
+                        if g_[p] != c:
+                            m = min(g_[p], c)
+                            k = m + hypot(ux + dx - sx, uy + dy - sy) + km
+                            qk_[p] = k
+                            heappush(queue, (k, m, p))
+                        else:
+                            qk_[p] = nan
+            else:
+                g_[u] = inf
+                self._update_vertex(u)
+                for offset, _, _, _ in moves[mask_[u]]:
+                    self._update_vertex(u + offset)
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates, reusing the previous search where possible.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        width = self.map.width
+
+        if (goal_idx != self._goal_idx or self._sdf_weight != self.sdf_weight
+                or self._cell_cost is not self.map.traversal_cost(self.sdf_weight)):
+            self._initialize(start_idx, goal_idx)
+        elif start_idx != self._start_idx:
+            sy, sx = divmod(self._start_idx, width)
+            self._km += math.hypot(start[0] - sx, start[1] - sy)
+            self._start_idx = start_idx
+
+        self.expansions = 0
+        self._compute_shortest_path()
+
+        if self._g_[start_idx] == np.inf:
+            raise NoPathFoundException
+
+        g_, cell_, mask_, moves = self._g_, self._cell_, self._mask_, self._moves
+        current = start_idx
+        path: List[GridLocation] = []
+        while current != goal_idx:
+            best, best_cost = -1, np.inf
+            for offset, _, _, step_cost in moves[mask_[current]]:
+                next = current + offset
+                next_cost = step_cost + cell_[next] + g_[next]
+                if next_cost < best_cost:
+                    best, best_cost = next, next_cost
+            if best < 0:
+                raise NoPathFoundException
+            current = best
+            y, x = divmod(current, width)
+            path.append(GridLocation(x, y))
+
+        return path
+
+
+class ThetaStarPlanner(Planner):
+    '''Any-angle planner (Lazy Theta*) on the signed distance grid.
+
+    Like A*, but a cell may take its parent's parent as its own parent when the straight
+    segment between them is clear, so paths are not restricted to the 8 grid headings.
+    Line of sight is checked lazily, once per expanded cell, by sphere tracing the
+    segment on the SDF; it accepts exactly the segments
+    :meth:`SignedDistanceGrid.line_of_sight` does. A clear segment costs its length
+    plus the SDF penalty of every cell on its grid line, the same penalty a grid path
+    charges per cell entered, so segments win over grid zig-zags whenever they are
+    shorter.
+
+    Returned paths are sparse: one waypoint per heading change.
+    '''
+
+    def _line_of_sight(self, a:int, b:int, sdf:np.ndarray, sdf_) -> bool:
+        '''Sphere-traced :meth:`SignedDistanceGrid.line_of_sight` between flat cells `a` and `b`.
+
+        Visits the same half-cell samples as `line_of_sight`, but from each sample skips
+        the following ones that provably round to passable cells: a sample within `s` of
+        the current one rounds to a cell within ``s + 1.5`` of the current cell, and no
+        impassable cell is nearer than the current cell's clearance. Open areas need only
+        a few lookups; segments still close to walls after those are checked in one
+        vectorized lookup. `sdf` is the flat undilated distance grid, `sdf_` a memoryview of it.
+        '''
+        width, offset = self.map.width, self.map.offset
+        ay, ax = divmod(a, width)
+        by, bx = divmod(b, width)
+        dx, dy = bx - ax, by - ay
+        n = 2*max(abs(dx), abs(dy)) + 1
+        length = math.hypot(dx, dy)
+        k = 0
+        for _ in range(8):
+            # n is odd, so samples never fall halfway between cells and round() matches np.rint.
+            clearance = sdf_[round(ay + dy*k/n)*width + round(ax + dx*k/n)] - offset
+            if clearance <= 0:
+                return False
+            if clearance - 1.5 >= length:
+                return True
+            skip = int((clearance - 1.5)*n/length)
+            k += skip if skip > 1 else 1
+            if k > n:
+                return True
+        t = np.arange(k, n + 1)/n
+        cells = np.rint(ay + dy*t).astype(np.intp)*width + np.rint(ax + dx*t).astype(np.intp)
+        return bool(np.all(sdf[cells] > offset))
+
+    def _segment_cost(self, a:int, b:int, cell_cost:np.ndarray, cell_, steps:np.ndarray) -> float:
+        '''Cost of the straight segment between flat cells `a` and `b`, which must be in line of sight.
+
+        The segment enters one cell per step along its major axis, like the 8-connected
+        grid path that follows it, and pays each cell's :meth:`SignedDistanceGrid.traversal_cost`.
+        `cell_` is a memoryview of `cell_cost`, `steps` is ``arange(m)`` for any m above the
+        segment's length in cells.
+        '''
+        width = self.map.width
+        ay, ax = divmod(a, width)
+        by, bx = divmod(b, width)
+        length = math.hypot(bx - ax, by - ay)
+        if self.sdf_weight == 0:
+            return length
+        n = max(abs(bx - ax), abs(by - ay))
+        # cells are rounded half up; coordinates are never negative, so int() floors.
+        if n <= 24:
+            # short segments: a python loop beats numpy's call overhead.
+            ux, uy = (bx - ax)/n, (by - ay)/n
+            fx, fy = ax + 0.5, ay + 0.5
+            return length + sum([cell_[int(fy + uy*k)*width + int(fx + ux*k)] for k in range(1, n + 1)])
+        k = steps[1:n + 1]*(1/n)
+        cells = (ay + 0.5 + (by - ay)*k).astype(np.intp)*width + (ax + 0.5 + (bx - ax)*k).astype(np.intp)
+        return length + float(cell_cost[cells].sum())
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan an any-angle path in grid coordinates.
+
+        See :meth:`Planner.plan_grid` for parameters and exceptions. The returned
+        waypoints are the corners of the path, not every cell along it.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        width = self.map.width
+        gx, gy = goal[0], goal[1]
+
+        cell_cost = self.map.traversal_cost(self.sdf_weight)
+        moves = self.map.neighbour_offsets()
+        # the base grid, not map.grid: that would materialize a dilated copy of the map.
+        sdf = np.ascontiguousarray(self.map._grid, dtype=float).ravel()
+        sdf_ = memoryview(sdf)
+        steps = np.arange(max(width, self.map.height) + 1, dtype=float)
+
+        cost_so_far = np.full(cell_cost.size, np.inf)
+        came_from = np.full(cell_cost.size, -1, dtype=np.int64)
+        closed = np.zeros(cell_cost.size, dtype=np.uint8)
+        cell_, mask_, cost_, came_, closed_ = (
+            memoryview(a) for a in (cell_cost, self.map.neighbour_mask(), cost_so_far, came_from, closed))
+
+        cost_[start_idx] = 0.0
+        came_[start_idx] = start_idx
+        frontier = [(0.0, start_idx)]
+        heappop, heappush, hypot = heapq.heappop, heapq.heappush, math.hypot
+        expansions = 0
+
+        while frontier:
+            _, current = heappop(frontier)
+            if closed_[current]:
+                continue
+
+            y, x = divmod(current, width)
+            parent = came_[current]
+            if parent != current:
+                py, px = divmod(parent, width)
+                if abs(px - x) > 1 or abs(py - y) > 1:
+                    # lazy line of sight check: keep the parent's parent only if the
+                    # segment is clear and no cheaper via a closed grid neighbour.
+                    best_cost = np.inf
+                    if self._line_of_sight(parent, current, sdf, sdf_):
+                        best_cost = cost_[parent] + self._segment_cost(parent, current, cell_cost, cell_, steps)
+                    for offset, _, _, step_cost in moves[mask_[current]]:
+                        n = current + offset
+                        if closed_[n]:
+                            n_cost = cost_[n] + step_cost + cell_[current]
+                            if n_cost < best_cost:
+                                best_cost, parent = n_cost, n
+                    cost_[current] = best_cost
+                    came_[current] = parent
+
+            if current == goal_idx:
+                break
+            closed_[current] = 1
+            expansions += 1
+            if not expansions & 4095:
+                self._check_cancelled()
+
+            current_cost = cost_[current]
+            if parent != current:
+                # optimistic path from the parent straight to next, verified on expansion:
+                # the penalty paid up to current plus that of next.
+                py, px = divmod(parent, width)
+                via_parent = current_cost - hypot(x - px, y - py)
+            for offset, dx, dy, step_cost in moves[mask_[current]]:
+                next = current + offset
+                if closed_[next]:
+                    continue
+                nx, ny = x + dx, y + dy
+                if parent != current:
+                    new_cost = via_parent + hypot(nx - px, ny - py) + cell_[next]
+                    new_parent = parent
+                else:
+                    new_cost = current_cost + step_cost + cell_[next]
+                    new_parent = current
+                if new_cost < cost_[next]:
+                    cost_[next] = new_cost
+                    came_[next] = new_parent
+                    heappush(frontier, (new_cost + hypot(nx - gx, ny - gy), next))
+
+        self.expansions = expansions
+        if came_[goal_idx] < 0:
+            raise NoPathFoundException
+
+        path: List[GridLocation] = []
+        current = goal_idx
+        while current != start_idx:
+            y, x = divmod(current, width)
+            path.append(GridLocation(x, y))
+            current = came_[current]
+        path.reverse()
+        return path
+
+
+class JumpPointPlanner(Planner):
+    '''Jump Point Search planner for uniform-cost maps.
+
+    With ``sdf_weight == 0`` every move costs its length, so runs of symmetric paths
+    through open space can be skipped: the search only stops ("jumps") at cells with
+    forced neighbours next to obstacles, and only those jump points enter the queue.
+    Paths are optimal and expanded back to one waypoint per cell like :class:`Planner`.
+
+    When ``sdf_weight != 0`` costs are not uniform and JPS pruning is no longer valid,
+    so :meth:`plan_grid` falls back to the regular A* of :class:`Planner`.
+    '''
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates with Jump Point Search.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        if self.sdf_weight != 0:
+            return super().plan_grid(start, goal)
+
+        self._check_endpoints(start, goal)
+        # passability with a blocked 1-cell border, so jumps need no bounds checks.
+        stride = self.map.width + 2
+        passable = np.pad(self.map.passable_mask(), 1, constant_values=False)
+        passable_ = passable.ravel().tobytes()
+        start_idx = (start[1] + 1)*stride + start[0] + 1
+        goal_idx = (goal[1] + 1)*stride + goal[0] + 1
+        gy, gx = divmod(goal_idx, stride)
+
+        def jump(current:int, dx:int, dy:int) -> int:
+            '''Walk from `current` in direction (dx, dy) to the next jump point, -1 if none.'''
+            step = dy*stride + dx
+            while True:
+                current += step
+                if not passable_[current]:
+                    return -1
+                if current == goal_idx:
+                    return current
+                if dx and dy:
+                    if ((not passable_[current - dx] and passable_[current - dx + dy*stride])
+                            or (not passable_[current - dy*stride] and passable_[current + dx - dy*stride])):
+                        return current
+                    if jump(current, dx, 0) >= 0 or jump(current, 0, dy) >= 0:
+                        return current
+                elif dx:
+                    if ((not passable_[current + stride] and passable_[current + dx + stride])
+                            or (not passable_[current - stride] and passable_[current + dx - stride])):
+                        return current
+                else:
+                    if ((not passable_[current + 1] and passable_[current + 1 + dy*stride])
+                            or (not passable_[current - 1] and passable_[current - 1 + dy*stride])):
+                        return current
+
+        def directions(current:int, parent:int):
+            '''Pruned set of directions to search from `current`, given where it was reached from.'''
+            if parent < 0:
+                return [(dx, dy) for dx, dy, _ in NEIGHBOUR_DIRECTIONS]
+            cy, cx = divmod(current, stride)
+            py, px = divmod(parent, stride)
+            dx, dy = (cx > px) - (cx < px), (cy > py) - (cy < py)
+            if dx and dy:
+                dirs = [(dx, dy), (dx, 0), (0, dy)]
+                if not passable_[current - dx]:
+                    dirs.append((-dx, dy))
+                if not passable_[current - dy*stride]:
+                    dirs.append((dx, -dy))
+            elif dx:
+                dirs = [(dx, 0)]
+                if not passable_[current + stride]:
+                    dirs.append((dx, 1))
+                if not passable_[current - stride]:
+                    dirs.append((dx, -1))
+            else:
+                dirs = [(0, dy)]
+                if not passable_[current + 1]:
+                    dirs.append((1, dy))
+                if not passable_[current - 1]:
+                    dirs.append((-1, dy))
+            return dirs
+
+        cost_so_far: Dict[int, float] = {start_idx: 0.0}
+        came_from: Dict[int, int] = {start_idx: -1}
+        closed = set()
+        frontier = [(0.0, start_idx)]
+        heappop, heappush, hypot = heapq.heappop, heapq.heappush, math.hypot
+        expansions = 0
+
+        while frontier:
+            _, current = heappop(frontier)
+            if current in closed:
+                continue
+            if current == goal_idx:
+                break
+            closed.add(current)
+            expansions += 1
+            if not expansions & 255:
+                self._check_cancelled()
+
+            cy, cx = divmod(current, stride)
+            current_cost = cost_so_far[current]
+            for dx, dy in directions(current, came_from[current]):
+                next = jump(current, dx, dy)
+                if next < 0 or next in closed:
+                    continue
+                ny, nx = divmod(next, stride)
+                new_cost = current_cost + hypot(nx - cx, ny - cy)
+                if new_cost < cost_so_far.get(next, np.inf):
+                    cost_so_far[next] = new_cost
+                    came_from[next] = current
+                    heappush(frontier, (new_cost + hypot(nx - gx, ny - gy), next))
+
+        self.expansions = expansions
+        if goal_idx not in came_from:
+            raise NoPathFoundException
+
+        # expand the straight/diagonal runs between jump points back into cells.
+        path: List[GridLocation] = []
+        current = goal_idx
+        while current != start_idx:
+            parent = came_from[current]
+            cy, cx = divmod(current, stride)
+            py, px = divmod(parent, stride)
+            dx, dy = (cx > px) - (cx < px), (cy > py) - (cy < py)
+            while (cx, cy) != (px, py):
+                path.append(GridLocation(cx - 1, cy - 1))
+                cx, cy = cx - dx, cy - dy
+            current = parent
+        path.reverse()
+        return path
+
+
+
+class _ClusterAbstraction(NamedTuple):
+    '''Abstract graph of a map split into square clusters, see :class:`HierarchicalPlanner`.'''
+
+    cluster_of: np.ndarray
+    '''Flat (height*width,) cluster id of every cell.'''
+
+    node_cells: np.ndarray
+    '''Flat cell index of every abstract node.'''
+
+    node_clusters: np.ndarray
+    '''Cluster id of every abstract node.'''
+
+    rows: np.ndarray
+    cols: np.ndarray
+    costs: np.ndarray
+    '''Abstract edges (node -> node, cost) in COO form.'''
+
+
+class HierarchicalPlanner(Planner):
+    '''Hierarchical planner (HPA*) over a coarse graph of map clusters.
+
+    The map is split into square clusters of `cluster_size` cells. Once per map (and
+    `sdf_weight`), every contiguous run of passable cells along a cluster border gets
+    one entrance, and the costs between the entrances of each cluster are found with a
+    Dijkstra search restricted to that cluster. This abstract graph is cached.
+
+    A query connects start and goal to the entrances of their clusters, searches the
+    small abstract graph, then runs a full-resolution A* restricted to the corridor of
+    clusters the abstract path passes through. Same cost model, path format and
+    exceptions as :class:`Planner`; paths are near-optimal.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, cluster_size:int=50, **kwargs):
+        '''
+        Parameters
+        ----------
+        map : SignedDistanceGrid
+            Distance grid map
+        sdf_weight: float
+            Relative weight of distance in cost function.
+        cluster_size: int
+            Side length of clusters in grid cells.
+        '''
+        super().__init__(map_, sdf_weight, **kwargs)
+        self.cluster_size = cluster_size
+        self._abstraction = None
+        self._abstraction_key = None
+        self._abstraction_map = None
+
+    def update_map(self, map:SignedDistanceGrid):
+        '''Update planner with new map. Drops the cached abstract graph.'''
+        super().update_map(map)
+        self._abstraction = None
+
+    def abstraction(self) -> _ClusterAbstraction:
+        '''Abstract cluster graph of the current map, built on first use and cached.'''
+        key = (self.sdf_weight, self.cluster_size)
+        if self._abstraction is None or self._abstraction_key != key or self._abstraction_map != self.map.fingerprint():
+            self._abstraction = self._build_abstraction()
+            self._abstraction_key = key
+            self._abstraction_map = self.map.fingerprint()
+        return self._abstraction
+
+    def _build_abstraction(self) -> _ClusterAbstraction:
+        width, height, size = self.map.width, self.map.height, self.cluster_size
+        clusters_x = -(-width // size)
+        ys, xs = np.divmod(np.arange(width*height), width)
+        cluster_of = (ys // size)*clusters_x + xs // size
+
+        # Moves between passable cells that cross a cluster border.
+        graph = self.map.transition_graph(self.sdf_weight).tocoo()
+        u, v = graph.row, graph.col
+        crossing = cluster_of[u] < cluster_of[v]
+        u, v = u[crossing], v[crossing]
+
+        # Group crossing moves into entrances: contiguous runs along the border of a
+        # cluster pair. Position along the border is y for side-by-side clusters, else x.
+        cu, cv = cluster_of[u], cluster_of[v]
+        side_by_side = (cu // clusters_x) == (cv // clusters_x)
+        pos_u = np.where(side_by_side, u // width, u % width)
+        pos_v = np.where(side_by_side, v // width, v % width)
+        order = np.lexsort((pos_v, pos_u, cv, cu))
+        u, v, cu, cv, pos_u, pos_v = (a[order] for a in (u, v, cu, cv, pos_u, pos_v))
+        new_run = np.ones(len(u), dtype=bool)
+        new_run[1:] = ((cu[1:] != cu[:-1]) | (cv[1:] != cv[:-1])
+                       | (np.abs(np.diff(pos_u)) > 1) | (np.abs(np.diff(pos_v)) > 1))
+        run_starts = np.flatnonzero(new_run)
+        run_ends = np.append(run_starts[1:], len(u))
+        middle = (run_starts + run_ends) // 2
+        u, v = u[middle], v[middle]
+
+        node_cells, node_of = np.unique(np.concatenate([u, v]), return_inverse=True)
+        node_u, node_v = node_of[:len(u)], node_of[len(u):]
+        node_clusters = cluster_of[node_cells]
+
+        # Inter-cluster edges, both directions.
+        forward = self.map.transition_graph(self.sdf_weight)
+        rows = [node_u, node_v]
+        cols = [node_v, node_u]
+        costs = [np.asarray(forward[u, v]).ravel(), np.asarray(forward[v, u]).ravel()]
+
+        # Intra-cluster edges between entrances of the same cluster.
+        for cluster in np.unique(node_clusters):
+            nodes = np.flatnonzero(node_clusters == cluster)
+            cells = self._cluster_cells(cluster)
+            local = np.searchsorted(cells, node_cells[nodes])
+            dist = dijkstra(forward[cells][:, cells], directed=True, indices=local)[:, local]
+            src, dst = np.nonzero(np.isfinite(dist) & (dist > 0))
+            rows.append(nodes[src])
+            cols.append(nodes[dst])
+            costs.append(dist[src, dst])
+
+        return _ClusterAbstraction(cluster_of, node_cells, node_clusters,
+                                   np.concatenate(rows), np.concatenate(cols), np.concatenate(costs))
+
+    def _cluster_cells(self, cluster:int) -> np.ndarray:
+        '''Sorted flat indices of the cells in `cluster`.'''
+        width, height, size = self.map.width, self.map.height, self.cluster_size
+        clusters_x = -(-width // size)
+        cy, cx = divmod(int(cluster), clusters_x)
+        ys = np.arange(cy*size, min((cy + 1)*size, height))
+        xs = np.arange(cx*size, min((cx + 1)*size, width))
+        return (ys[:, None]*width + xs[None, :]).ravel()
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates on the abstract graph, then refine in its corridor.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        abstract = self.abstraction()
+        if abstract.node_cells.size == 0:
+            # one cluster, or no open cluster borders: nothing to abstract.
+            return self._astar(start_idx, goal_idx, self.map.traversal_cost(self.sdf_weight))
+
+        forward = self.map.transition_graph(self.sdf_weight)
+        n = len(abstract.node_cells)
+        s_node, g_node = n, n + 1
+        start_cluster, goal_cluster = abstract.cluster_of[start_idx], abstract.cluster_of[goal_idx]
+
+        # Connect start and goal to the entrances of their own clusters.
+        rows, cols, costs = [abstract.rows], [abstract.cols], [abstract.costs]
+        for cluster, cell, node, reverse in ((start_cluster, start_idx, s_node, False),
+                                             (goal_cluster, goal_idx, g_node, True)):
+            cells = self._cluster_cells(cluster)
+            sub = forward[cells][:, cells]
+            dist = dijkstra(sub.T.tocsr() if reverse else sub, directed=True,
+                            indices=np.searchsorted(cells, cell))
+            nodes = np.flatnonzero(abstract.node_clusters == cluster)
+            targets = abstract.node_cells[nodes]
+            if not reverse and goal_cluster == start_cluster:
+                # direct path inside the shared cluster.
+                nodes = np.append(nodes, g_node)
+                targets = np.append(targets, goal_idx)
+            d = dist[np.searchsorted(cells, targets)]
+            reachable = np.isfinite(d)
+            nodes = nodes[reachable]
+            rows.append(nodes if reverse else np.full(len(nodes), node))
+            cols.append(np.full(len(nodes), node) if reverse else nodes)
+            costs.append(d[reachable])
+
+        graph = csr_matrix((np.concatenate(costs), (np.concatenate(rows), np.concatenate(cols))), shape=(n + 2, n + 2))
+        dist, predecessors = dijkstra(graph, directed=True, indices=s_node, return_predecessors=True)
+        if not np.isfinite(dist[g_node]):
+            self.expansions = 0
+            raise NoPathFoundException
+
+        # Corridor: every cluster the abstract path passes through.
+        corridor = {start_cluster, goal_cluster}
+        node = predecessors[g_node]
+        while node != s_node:
+            corridor.add(abstract.node_clusters[node])
+            node = predecessors[node]
+        in_corridor = np.isin(abstract.cluster_of, list(corridor))
+        cell_cost = np.where(in_corridor, self.map.traversal_cost(self.sdf_weight), np.inf)
+
+        return self._astar(start_idx, goal_idx, cell_cost)
+
+
+
+class CheckpointPathCache:
+    '''Precomputes paths between a fixed set of locations in the background.
+
+    The checkpoints of a run are known in advance (robot start, valid checkpoints,
+    detour checkpoints). After :meth:`start`, a background thread plans every ordered
+    pair of them with one cost-to-go field per goal (see :class:`CostToGoPlanner`), so
+    by the time the robot reaches a checkpoint the path to the next one is a lookup.
+
+    Paths use the map, `sdf_weight`, `shortcut_clearance` and `snap_endpoints` of the
+    given planner at construction time; locations in obstacles are snapped like in
+    :meth:`Planner.plan`.
+    '''
+
+    def __init__(self, planner:Planner, locations:Sequence[RealLocation], tolerance:float=0.2):
+        '''
+        Parameters
+        ----------
+        planner : Planner
+            Planner whose map and settings to plan with.
+        locations : Sequence[RealLocation]
+            Candidate start and goal locations.
+        tolerance : float
+            How close (real units) a query start/goal must be to a location to match it.
+        '''
+        self.locations = list(locations)
+        self.tolerance = tolerance
+        self.cost_matrix = np.full((len(self.locations), len(self.locations)), np.nan)
+        '''Path costs, ``cost_matrix[i, j]`` from location i to j. nan until computed, inf if unreachable.'''
+
+        self._planner = CostToGoPlanner(planner.map, planner.sdf_weight, shortcut_clearance=planner.shortcut_clearance,
+                                        snap_endpoints=planner.snap_endpoints)
+        self._paths: Dict[Tuple[int, int], List[RealLocation]] = {}
+        self._lock = Lock()
+        self._thread = None
+
+    def start(self):
+        '''Start precomputing in a daemon thread. Returns immediately.'''
+        if self._thread is None:
+            self._thread = Thread(target=self._precompute, daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout:Optional[float]=None) -> bool:
+        '''Block until precomputation finishes or `timeout` s pass. Returns True if done.'''
+        if self._thread is None:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _precompute(self):
+        # snap like plan() does, so locations just inside a dilated obstacle are kept.
+        grid_locs = [self._planner._snap(self._planner.map.real_to_grid(loc)) for loc in self.locations]
+        for j, goal in enumerate(grid_locs):
+            if not self._planner.is_valid_position(goal):
+                logging.getLogger('CheckpointPathCache').warning(f"Skipping invalid location {self.locations[j]}.")
+                continue
+            field = self._planner.cost_to_go(goal)
+            for i, start in enumerate(grid_locs):
+                if i == j or not self._planner.is_valid_position(start):
+                    continue
+                cost = field[start[1]*self._planner.map.width + start[0]]
+                path = self._planner.plan(self.locations[i], self.locations[j]) if np.isfinite(cost) else None
+                with self._lock:
+                    self.cost_matrix[i, j] = cost
+                    if path is not None:
+                        self._paths[(i, j)] = path
+        logging.getLogger('CheckpointPathCache').info(f"Precomputed {len(self._paths)} checkpoint paths.")
+
+    def _match(self, loc:RealLocation) -> int:
+        '''Index of the location within `tolerance` of `loc`, -1 if none.'''
+        for i, candidate in enumerate(self.locations):
+            if euclidean_distance(candidate, loc) <= self.tolerance:
+                return i
+        return -1
+
+    def get(self, start:RealLocation, goal:RealLocation) -> Optional[List[RealLocation]]:
+        '''Cached path from `start` to `goal`.
+
+        Returns
+        -------
+        path
+            List of RealLocation from the matched start location to the matched goal, or
+            None if either does not match a location or the path is not computed (yet).
+        '''
+        i, j = self._match(start), self._match(goal)
+        if i < 0 or j < 0:
+            return None
+        with self._lock:
+            path = self._paths.get((i, j))
+        return list(path) if path is not None else None
+
+
+class BidirectionalPlanner(Planner):
+    '''Bidirectional A* (NBA*) that searches from start and goal at the same time.
+
+    The two searches share the cost model of :class:`Planner`; the backward search
+    follows moves in reverse. Each step expands the side with the smaller queue. A cell
+    is pruned once it provably cannot improve the best meeting cost found so far, and
+    the search stops when either queue runs out, at which point the best meeting point
+    gives an optimal path. On long trips this expands two small regions instead of one
+    large one around the start.
+
+    Same path format and exceptions as :class:`Planner`.
+    '''
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates with bidirectional A*.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        width = self.map.width
+        self.expansions = 0
+        if start_idx == goal_idx:
+            return []
+
+        cell_cost = self.map.traversal_cost(self.sdf_weight)
+        moves = self.map.neighbour_offsets()
+        n = cell_cost.size
+        cost_fwd, cost_bwd = np.full(n, np.inf), np.full(n, np.inf)
+        came_fwd, came_bwd = np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)
+        done = np.zeros(n, dtype=np.uint8)  # expanded or pruned by either side.
+        cell_, mask_, done_ = (memoryview(a) for a in (cell_cost, self.map.neighbour_mask(), done))
+        sides = (
+            # (queue, costs, other side's costs, parents, target x, target y, source x, source y)
+            ([], memoryview(cost_fwd), memoryview(cost_bwd), memoryview(came_fwd), goal[0], goal[1], start[0], start[1]),
+            ([], memoryview(cost_bwd), memoryview(cost_fwd), memoryview(came_bwd), start[0], start[1], goal[0], goal[1]),
+        )
+        heappop, heappush, hypot = heapq.heappop, heapq.heappush, math.hypot
+
+        best, meet = np.inf, -1
+        f_min = [hypot(goal[0] - start[0], goal[1] - start[1])]*2  # lowest f in each queue.
+        for (queue, cost_, _, _, _, _, _, _), idx in zip(sides, (start_idx, goal_idx)):
+            cost_[idx] = 0.0
+            queue.append((f_min[0], idx))
+
+        expansions = 0
+        while sides[0][0] and sides[1][0]:
+            side = 0 if len(sides[0][0]) <= len(sides[1][0]) else 1
+            queue, cost_, other_, came_, tx, ty, sx, sy = sides[side]
+            forward = side == 0
+
+            _, current = heappop(queue)
+            if done_[current]:
+                continue
+            done_[current] = 1
+
+            y, x = divmod(current, width)
+            current_cost = cost_[current]
+            if (current_cost + hypot(x - tx, y - ty) < best
+                    and current_cost + f_min[1 - side] - hypot(x - sx, y - sy) < best):
+                expansions += 1
+                if not expansions & 4095:
+                    self._check_cancelled()
+
+                for offset, dx, dy, step_cost in moves[mask_[current]]:
+                    next = current + offset
+                    if done_[next]:
+                        continue
+                    # moving backwards over (next -> current) costs entering current.
+                    new_cost = current_cost + step_cost + (cell_[next] if forward else cell_[current])
+                    if new_cost < cost_[next]:
+                        cost_[next] = new_cost
+                        came_[next] = current
+                        heappush(queue, (new_cost + hypot(x + dx - tx, y + dy - ty), next))
+                        if new_cost + other_[next] < best:
+                            best, meet = new_cost + other_[next], next
+
+            f_min[side] = queue[0][0] if queue else np.inf
+
+        self.expansions = expansions
+        if meet < 0:
+            raise NoPathFoundException
+
+        path = self._trace_flat_path(came_fwd, start_idx, meet)
+        came_bwd_ = memoryview(came_bwd)
+        current = meet
+        while current != goal_idx:
+            current = came_bwd_[current]
+            y, x = divmod(current, width)
+            path.append(GridLocation(x, y))
+        return path
+
+
+
+class AnytimePlanner(Planner):
+    '''Anytime Repairing A* (ARA*) planner with a planning time budget.
+
+    The first search inflates the heuristic by `initial_epsilon`, which finds a path
+    quickly whose cost is at most that factor above optimal. Each following search
+    lowers the inflation by `epsilon_step` and reuses the previous search effort, until
+    the path is provably optimal (bound 1).
+
+    :meth:`plan_grid` returns the best path found within `time_budget` seconds.
+    :meth:`plan_anytime` returns within a deadline as well, but keeps improving the path
+    in a background thread and publishes each better path with its suboptimality bound.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, initial_epsilon:float=3.0,
+                 epsilon_step:float=0.5, time_budget:float=0.5, **kwargs):
+        '''
+        Parameters
+        ----------
+        map : SignedDistanceGrid
+            Distance grid map
+        sdf_weight: float
+            Relative weight of distance in cost function.
+        initial_epsilon: float
+            Heuristic inflation of the first search, >= 1.
+        epsilon_step: float
+            Decrease of the inflation between searches.
+        time_budget: float
+            Seconds :meth:`plan_grid` may spend improving on the first path.
+        '''
+        super().__init__(map_, sdf_weight, **kwargs)
+        self.initial_epsilon = initial_epsilon
+        self.epsilon_step = epsilon_step
+        self.time_budget = time_budget
+        self.bound = np.inf
+        '''Suboptimality bound of the last returned or published path.'''
+        self._stop_improving = Event()
+
+    def _ara_star(self, start_idx:int, goal_idx:int) -> Iterator[Optional[Tuple[List[GridLocation], float]]]:
+        '''Run ARA*, yielding ``(path, bound)`` after each search and None every few thousand expansions.
+
+        Yielding None lets the caller check deadlines without losing search state.
+        '''
+        width = self.map.width
+        gy, gx = divmod(goal_idx, width)
+        cell_cost = self.map.traversal_cost(self.sdf_weight)
+        moves = self.map.neighbour_offsets()
+        n = cell_cost.size
+
+        cost_so_far = np.full(n, np.inf)
+        came_from = np.full(n, -1, dtype=np.int64)
+        closed = np.full(n, -1, dtype=np.int32)  # number of the search that closed the cell.
+        in_open = np.zeros(n, dtype=np.uint8)
+        in_incons = np.zeros(n, dtype=np.uint8)
+        cell_, mask_, cost_, came_, closed_, open_, incons_ = (memoryview(a) for a in (
+            cell_cost, self.map.neighbour_mask(), cost_so_far, came_from, closed, in_open, in_incons))
+        heappop, heappush, hypot = heapq.heappop, heapq.heappush, math.hypot
+
+        def h(u:int) -> float:
+            uy, ux = divmod(u, width)
+            return hypot(ux - gx, uy - gy)
+
+        epsilon = max(self.initial_epsilon, 1.0)
+        cost_[start_idx] = 0.0
+        open_[start_idx] = 1
+        frontier = [(epsilon*h(start_idx), 0.0, start_idx)]
+        incons: List[int] = []
+        search = 0
+        self.expansions = 0
+
+        while True:
+            # ImprovePath: expand until no queued cell can beat the goal's cost.
+            while frontier:
+                f, g, current = frontier[0]
+                if not open_[current] or g != cost_[current]:
+                    heappop(frontier)  # stale entry.
+                    continue
+                if f >= cost_[goal_idx]:
+                    break
+                heappop(frontier)
+                open_[current] = 0
+                closed_[current] = search
+                self.expansions += 1
+                if not self.expansions & 4095:
+                    self._check_cancelled()
+                    yield None
+
+                y, x = divmod(current, width)
+                for offset, dx, dy, step_cost in moves[mask_[current]]:
+                    next = current + offset
+                    new_cost = g + step_cost + cell_[next]
+                    if new_cost < cost_[next]:
+                        cost_[next] = new_cost
+                        came_[next] = current
+                        if closed_[next] != search:
+                            open_[next] = 1
+                            heappush(frontier, (new_cost + epsilon*hypot(x + dx - gx, y + dy - gy), new_cost, next))
+                        elif not incons_[next]:
+                            incons_[next] = 1
+                            incons.append(next)
+
+            if cost_[goal_idx] == np.inf:
+                raise NoPathFoundException
+
+            # Cells that may still lead to a cheaper path: open and inconsistent ones.
+            pending = [u for _, g, u in frontier if open_[u] and g == cost_[u]] + incons
+            pending = list(set(pending))
+            lower = min((cost_[u] + h(u) for u in pending), default=np.inf)
+            bound = min(epsilon, cost_[goal_idx]/lower) if lower > 0 else epsilon
+            yield self._trace_flat_path(came_from, start_idx, goal_idx), max(bound, 1.0)
+
+            if epsilon <= 1.0 or bound <= 1.0:
+                return
+
+            epsilon = max(epsilon - self.epsilon_step, 1.0)
+            search += 1
+            for u in incons:
+                incons_[u] = 0
+                open_[u] = 1
+            incons = []
+            frontier = [(cost_[u] + epsilon*h(u), cost_[u], u) for u in pending]
+            heapq.heapify(frontier)
+
+    def _start(self, start:GridLocation, goal:GridLocation) -> Iterator[Optional[Tuple[List[GridLocation], float]]]:
+        return self._ara_star(*self._check_endpoints(start, goal))
+
+    def _run_until(self, search, deadline:float) -> Tuple[Optional[List[GridLocation]], float]:
+        '''Advance `search` until it has a path and `deadline` (perf_counter) has passed, or it ends.'''
+        best, bound = None, np.inf
+        for result in search:
+            if result is not None:
+                best, bound = result
+            if best is not None and time.perf_counter() >= deadline:
+                break
+        return best, bound
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates, improving the path until `time_budget` runs out.
+
+        The first path is always completed, even if it takes longer than `time_budget`.
+        Its suboptimality bound is stored in :attr:`bound`. See :meth:`Planner.plan_grid`
+        for parameters, return value and exceptions.
+        '''
+        deadline = time.perf_counter() + self.time_budget
+        path, self.bound = self._run_until(self._start(start, goal), deadline)
+        return path
+
+    def plan_anytime(self, start:RealLocation, goal:RealLocation, deadline:float,
+                     on_improved:Optional[Callable[[List[RealLocation], float], None]]=None) -> List[RealLocation]:
+        '''Plan in real coordinates within `deadline` seconds, then keep improving in the background.
+
+        A later call stops the background improvement of the previous one. Invalid
+        endpoints are snapped like in :meth:`plan`.
+
+        Parameters
+        ----------
+        start: RealLocation
+            Starting location.
+        goal: RealLocation
+            Goal location.
+        deadline: float
+            Seconds to spend before returning. The first path is always completed.
+        on_improved: callable, optional
+            Called from the background thread as ``on_improved(path, bound)`` for every
+            better path found after returning.
+
+        Returns
+        -------
+        path
+            Best path found within the deadline; its bound is in :attr:`bound`.
+        '''
+        self._stop_improving.set()
+        stop = self._stop_improving = Event()
+
+        grid_start = self.map.real_to_grid(start)
+        snapped_start = self._snap(grid_start)
+        search = self._start(snapped_start, self._snap(self.map.real_to_grid(goal)))
+        prefix = [snapped_start] if snapped_start != grid_start else []
+        path, self.bound = self._run_until(search, time.perf_counter() + deadline)
+
+        def improve():
+            for result in search:
+                if stop.is_set():
+                    return
+                if result is not None:
+                    self.bound = result[1]
+                    if on_improved is not None:
+                        on_improved(self._finish_path(grid_start, prefix + result[0]), result[1])
+
+        if self.bound > 1.0:
+            Thread(target=improve, daemon=True).start()
+        return self._finish_path(grid_start, prefix + path)
+
+
+class LandmarkPlanner(Planner):
+    '''A* guided by landmark (ALT) lower bounds.
+
+    Distances to and from a few landmark cells are precomputed once per map by
+    :meth:`SignedDistanceGrid.landmark_distances`. For each goal, the heuristic is the
+    largest triangle-inequality bound over all landmarks, or the euclidean distance if
+    that is larger. It stays admissible, but knows about walls, so the search does not
+    flood dead-ends that point towards the goal.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, landmarks:int=8, **kwargs):
+        '''
+        Parameters
+        ----------
+        map : SignedDistanceGrid
+            Distance grid map
+        sdf_weight: float
+            Relative weight of distance in cost function.
+        landmarks: int
+            Number of landmark cells.
+        '''
+        super().__init__(map_, sdf_weight, **kwargs)
+        self.landmarks = landmarks
+        self._goal_heuristic = None  # (map fingerprint, goal index, heuristic) of the last goal.
+
+    def goal_heuristic(self, goal_idx:int) -> np.ndarray:
+        '''Float32 lower bound on the cost from every flat cell to `goal_idx`.'''
+        cached = self._goal_heuristic
+        if cached is not None and cached[0] == self.map.fingerprint() and cached[1] == goal_idx:
+            return cached[2]
+
+        _, from_, to = self.map.landmark_distances(self.sdf_weight, self.landmarks)
+        gy, gx = divmod(goal_idx, self.map.width)
+        ys, xs = np.indices((self.map.height, self.map.width), dtype=np.float32)
+        heuristic = np.hypot(xs - gx, ys - gy).ravel()
+
+        # landmarks in another component than the goal give no bound.
+        usable = np.isfinite(from_[:, goal_idx]) & np.isfinite(to[:, goal_idx])
+        for k in np.flatnonzero(usable):
+            np.maximum(heuristic, from_[k, goal_idx] - from_[k], out=heuristic)
+            np.maximum(heuristic, to[k] - to[k, goal_idx], out=heuristic)
+
+        self._goal_heuristic = (self.map.fingerprint(), goal_idx, heuristic)
+        return heuristic
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates with the landmark heuristic.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        return self._astar(start_idx, goal_idx, self.map.traversal_cost(self.sdf_weight), self.goal_heuristic(goal_idx))
+
+
+class _Roadmap(NamedTuple):
+    '''Sparse graph over the medial axis of a map, see :class:`RoadmapPlanner`.'''
+
+    node_cells: np.ndarray
+    '''Flat cell index of every node.'''
+
+    node_xy: np.ndarray
+    '''(k, 2) grid coordinates of every node.'''
+
+    clearance: np.ndarray
+    '''Distance to the nearest obstacle of every node, in real units.'''
+
+    graph: csr_matrix
+    '''(k, k) move costs between neighbouring nodes.'''
+
+    component: np.ndarray
+    '''Connected component label of every node.'''
+
+
+class RoadmapPlanner(Planner):
+    '''Planner over a roadmap extracted from the medial axis of the signed distance field.
+
+    Once per map, the cells of :meth:`SignedDistanceGrid.medial_axis` (the ridges of the
+    SDF, as far from walls as possible) become the nodes of a sparse graph, with the
+    usual move costs between neighbouring nodes. A query walks in a straight line from
+    the start to the nearest visible node, follows the roadmap, and leaves it in a
+    straight line towards the goal, so it only searches a few thousand nodes and the
+    path keeps maximum clearance. Paths are not shortest paths. A goal in line of sight
+    of the start is reached in one straight segment without the roadmap, and if the
+    roadmap cannot connect start and goal, the planner falls back to a full-grid A*
+    search.
+    '''
+
+    def __init__(self, map_:SignedDistanceGrid=None, sdf_weight:float=0.0, min_separation:float=3.0,
+                 min_component:int=10, connect_candidates:int=64, **kwargs):
+        '''
+        Parameters
+        ----------
+        map : SignedDistanceGrid
+            Distance grid map
+        sdf_weight: float
+            Relative weight of distance in cost function.
+        min_separation: float
+            Passed to :meth:`SignedDistanceGrid.medial_axis`.
+        min_component: int
+            Roadmap pieces with fewer nodes than this are dropped.
+        connect_candidates: int
+            Number of nearest nodes tried when connecting start and goal to the roadmap.
+        '''
+        super().__init__(map_, sdf_weight, **kwargs)
+        self.min_separation = min_separation
+        self.min_component = min_component
+        self.connect_candidates = connect_candidates
+        self._roadmap = None
+        self._roadmap_key = None
+        self._roadmap_map = None
+
+    def update_map(self, map:SignedDistanceGrid):
+        '''Update planner with new map. Drops the cached roadmap.'''
+        super().update_map(map)
+        self._roadmap = None
+
+    def roadmap(self) -> _Roadmap:
+        '''Roadmap of the current map, built on first use and cached.'''
+        key = (self.sdf_weight, self.min_separation, self.min_component)
+        if self._roadmap is None or self._roadmap_key != key or self._roadmap_map != self.map.fingerprint():
+            self._roadmap = self._build_roadmap()
+            self._roadmap_key = key
+            self._roadmap_map = self.map.fingerprint()
+        return self._roadmap
+
+    def _build_roadmap(self) -> _Roadmap:
+        cells = np.flatnonzero(self.map.medial_axis(self.min_separation))
+        graph = self.map.transition_graph(self.sdf_weight)[cells][:, cells]
+        _, component = connected_components(graph, directed=False)
+
+        # drop specks, e.g. at rounded obstacle corners.
+        keep = np.bincount(component)[component] >= self.min_component
+        cells, component = cells[keep], component[keep]
+        graph = graph[keep][:, keep]
+
+        ys, xs = np.divmod(cells, self.map.width)
+        node_xy = np.stack([xs, ys], axis=1)
+        clearance = self.map.sample(self.map.grid_to_real_batch(node_xy))
+        return _Roadmap(cells, node_xy, clearance, graph.tocsr(), component)
+
+    def _visible_nodes(self, roadmap:_Roadmap, cell:GridLocation) -> np.ndarray:
+        '''Nodes in line of sight of `cell`, nearest first, among the nearest `connect_candidates`.'''
+        d2 = ((roadmap.node_xy - np.array([cell[0], cell[1]]))**2).sum(axis=1)
+        k = min(self.connect_candidates, d2.size)
+        nearest = np.argpartition(d2, k - 1)[:k] if k < d2.size else np.arange(d2.size)
+        nearest = nearest[np.argsort(d2[nearest], kind='stable')]
+        visible = [n for n in nearest if self.map.line_of_sight(cell, GridLocation(*roadmap.node_xy[n].tolist()))]
+        return np.array(visible, dtype=np.int64)
+
+    def plan_grid(self, start:GridLocation, goal:GridLocation) -> List[GridLocation]:
+        '''Plan in grid coordinates along the roadmap.
+
+        See :meth:`Planner.plan_grid` for parameters, return value and exceptions.
+        Goals in line of sight of the start are reached directly, off the roadmap.
+        '''
+        start_idx, goal_idx = self._check_endpoints(start, goal)
+        self.expansions = 0
+        if start_idx == goal_idx:
+            return []
+        if self.map.line_of_sight(start, goal):
+            return [goal]
+
+        roadmap = self.roadmap()
+        entry = exit = None
+        if roadmap.node_cells.size:
+            exits = self._visible_nodes(roadmap, goal)
+            for node in self._visible_nodes(roadmap, start):
+                same = exits[roadmap.component[exits] == roadmap.component[node]]
+                if same.size:
+                    entry, exit = node, same[0]
+                    break
+
+        if entry is None:
+            logging.getLogger('RoadmapPlanner').info('Roadmap cannot connect start and goal, searching the full grid.')
+            return super().plan_grid(start, goal)
+
+        dist, predecessors = dijkstra(roadmap.graph, indices=entry, return_predecessors=True)
+        self.expansions = int(np.isfinite(dist).sum())
+
+        nodes = [exit]
+        while nodes[-1] != entry:
+            nodes.append(predecessors[nodes[-1]])
+        nodes.reverse()
+
+        path = [GridLocation(*roadmap.node_xy[n].tolist()) for n in nodes]
+        if path[0] == start:
+            path.pop(0)
+        if not path or path[-1] != goal:
+            path.append(goal)
+        return path